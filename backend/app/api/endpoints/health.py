@@ -1,14 +1,40 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core.background import background_runner
 from app.core.database import db
+from app.core.inference import inference_executor
+from app.core.loop_monitor import loop_monitor
+from app.services.vector_store import VectorStoreService
+from app.services.answer_cache import answer_cache
+from app.services.model_loader import model_loader
 import os
 
 router = APIRouter()
 
 @router.get("/")
 async def health_check():
+    # Liveness: answers as soon as the process serves requests, even while models load
     mongo_status = "Connected" if db.client else "Disconnected"
-    return {
+    health = {
         "status": "active",
         "environment": os.getenv("PROJECT_NAME", "Unknown"),
-        "database_status": mongo_status
+        "database_status": mongo_status,
+        "models": model_loader.stats(),
+        "inference_pending": inference_executor.pending,
+        "background_tasks_pending": background_runner.pending,
+        "event_loop_lag": loop_monitor.stats(),
+        "answer_cache": answer_cache.stats()
     }
+    vector_store = VectorStoreService.loaded()
+    if vector_store is not None:
+        health["inference_backend"] = vector_store.inference_backend
+        health["rerank_scheduler"] = vector_store.rerank_scheduler.stats()
+        health["embed_scheduler"] = vector_store.embed_scheduler.stats()
+        health["query_embedding_cache"] = vector_store.query_embedding_cache.stats()
+    return health
+
+@router.get("/ready")
+async def readiness_check():
+    # Readiness: 200 only once models and index are loaded and warmed up
+    stats = model_loader.stats()
+    return JSONResponse(status_code=200 if model_loader.ready else 503, content=stats)
@@ -1,36 +1,20 @@
 import os
 import shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
 from typing import List
-from app.services.document_processor import DocumentProcessor
-from app.services.vector_store import VectorStoreService
+from app.models.schemas import IngestJob
+from app.services.ingest_jobs import ingest_job_manager
 
 router = APIRouter()
-processor = DocumentProcessor()
-vector_store = VectorStoreService()
 
 UPLOAD_DIR = "data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-async def process_file_task(file_path: str, filename: str):
-    try:
-        metadata = {"source": filename, "type": "pdf"}
-        chunks = await processor.process_file(file_path, metadata)
-        
-        vector_store.add_documents(chunks)
-        print(f"Successfully processed {filename}: {len(chunks)} chunks added.")
-        
-    except Exception as e:
-        print(f"Error background processing {filename}: {e}")
-    finally:
-        pass
-
 @router.post("/")
 async def ingest_documents(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...)
 ):
-    saved_files = []
+    jobs = []
     
     for file in files:
         if not file.filename.endswith(".pdf"):
@@ -41,17 +25,28 @@ async def ingest_documents(
             with open(file_path, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
             
-            saved_files.append(file.filename)
-            # Add background task
-            background_tasks.add_task(process_file_task, file_path, file.filename)
-            
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to upload {file.filename}: {str(e)}")
 
-    if not saved_files:
+        job = await ingest_job_manager.submit(file.filename, file_path)
+        jobs.append({"job_id": job.job_id, "filename": job.filename})
+
+    if not jobs:
         raise HTTPException(status_code=400, detail="No valid PDF files found.")
 
     return {
-        "message": f"Received {len(saved_files)} files. Processing started in background.",
-        "files": saved_files
+        "message": f"Received {len(jobs)} files. Processing started in background.",
+        "files": [job["filename"] for job in jobs],
+        "jobs": jobs
     }
+
+@router.get("/", response_model=List[IngestJob])
+async def list_ingest_jobs(limit: int = Query(50, ge=1, le=500)):
+    return await ingest_job_manager.list(limit)
+
+@router.get("/{job_id}", response_model=IngestJob)
+async def get_ingest_job(job_id: str):
+    job = await ingest_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Ingest job {job_id} not found")
+    return job
@@ -1,65 +1,202 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Tuple
 from app.services.agent import compliance_agent, AgentDeps
+from app.services.answer_cache import is_standalone_query
 from app.services.vector_store import VectorStoreService
-from app.services.chat_history import ChatHistoryService
-from app.models.schemas import QueryRequest, QueryResponse
+from app.services.index_partitions import normalize_filter
+from app.services.chat_history import ChatHistoryService, chat_history_service
+from app.services.model_loader import model_loader
+from app.models.schemas import ComplianceAssessment, QueryRequest, QueryResponse
+from app.core.background import background_runner
+from app.core.inference import InferenceQueueFull
+from app.core.metrics import timed_stage
+from app.core.timeline import RequestTimeline
+from app.core.token_manager import token_manager
+import asyncio
+import json
+import time
 import uuid
 
 router = APIRouter()
 def get_vector_store():
+    # Models load in the background after startup; until then tell clients to come back
+    if not model_loader.ready:
+        raise HTTPException(status_code=503, detail=f"Models are {model_loader.status}", headers={"Retry-After": "5"})
     return VectorStoreService()
 
 def get_chat_service():
-    return ChatHistoryService()
+    return chat_history_service
+
+def get_metadata_filter(request: QueryRequest):
+    try:
+        return normalize_filter(request.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def format_history(history: List[Dict]) -> str:
+    # Most recent turns first, whole turns only, within HISTORY_TOKEN_BUDGET
+    if not history:
+        return ""
+    return token_manager.fit_history(history)
+
+async def _save_turn(chat_service: ChatHistoryService, session_id: str, messages: List[Dict]):
+    with timed_stage(None, "history_write"):
+        await chat_service.persist_turn(session_id, messages)
+
+def save_turn(chat_service: ChatHistoryService, session_id: str, query: str, response: str):
+    # Staged before returning, so the session's next question sees this turn even while it is being written
+    messages = chat_service.stage_turn(session_id, query, response)
+    # Fire-and-forget: the response never waits for the write, failures are logged and counted
+    background_runner.spawn(_save_turn(chat_service, session_id, messages), name="history_write")
+
+async def _load_history(chat_service: ChatHistoryService, session_id: str, timeline: RequestTimeline) -> str:
+    with timeline.stage("history_fetch"):
+        history = await chat_service.get_history(session_id)
+    with timeline.stage("history_budget"):
+        return format_history(history)
+
+def _discard(task: asyncio.Task):
+    task.cancel()
+    # A fetch that already failed must not be reported as an exception nobody retrieved
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def _prepare(request: QueryRequest, session_id: str, deps: AgentDeps, chat_service: ChatHistoryService,
+                   metadata_filter: Optional[Dict], timeline: RequestTimeline) -> Tuple[Optional[ComplianceAssessment], list, str]:
+    """
+    (KB intent answer, retrieved docs, formatted history). Retrieval does not depend
+    on the history, so both run concurrently; a KB intent answer does not wait for the history at all.
+    A context-dependent query ("is this compliant") only gets a KB intent answer in a new session.
+    """
+    standalone = is_standalone_query(request.query)
+    history_task = asyncio.create_task(_load_history(chat_service, session_id, timeline))
+    try:
+        with timeline.stage("retrieval"):
+            direct_answer, docs = await compliance_agent.prepare(request.query, deps, metadata_filter, match_intents=standalone)
+    except BaseException:
+        _discard(history_task)
+        raise
+    if direct_answer is not None:
+        _discard(history_task)
+        return direct_answer, docs, ""
+    formatted_history = await history_task
+    if not standalone and not formatted_history:
+        direct_answer = compliance_agent.kb_intent_answer(request.query, metadata_filter)
+    return direct_answer, docs, formatted_history
+
+def _sse(event: str, payload: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
 
 @router.post("/")
 async def query_compliance(
     request: QueryRequest,
+    response: Response,
     vector_store: VectorStoreService = Depends(get_vector_store),
-    chat_service: ChatHistoryService = Depends(get_chat_service)
+    chat_service: ChatHistoryService = Depends(get_chat_service),
+    metadata_filter: Optional[Dict] = Depends(get_metadata_filter)
 ):
     print(f"[QUERY] Processing: {request.query}")
     session_id = request.session_id or str(uuid.uuid4())
+    timeline = RequestTimeline()
     
     try:
-        # Retrieve conversation history
-        history = await chat_service.get_history(session_id)
-        
-        # Format history for better context
-        formatted_history = ""
-        if history:
-            formatted_history = "\n".join([
-                f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" 
-                for msg in history
-            ])
-        
         deps = AgentDeps(vector_store=vector_store)
+        # Conversation history loads while retrieval runs
+        direct_answer, docs, formatted_history = await _prepare(request, session_id, deps, chat_service, metadata_filter, timeline)
         
-        result = await compliance_agent.run(
-            query=request.query, 
-            deps=deps, 
-            history_context=formatted_history
-        )
-        print(f"[QUERY] Completed. Status: {result.data.status}")
-        
-        # Save user message
-        await chat_service.add_message(session_id, "user", request.query)
+        with timeline.stage("answer"):
+            result = await compliance_agent.run(
+                query=request.query, 
+                deps=deps, 
+                history_context=formatted_history,
+                docs=docs,
+                direct_answer=direct_answer
+            )
+        print(f"[QUERY] Completed. Status: {result.data.status}. Timeline: {timeline.summary()}")
+        response.headers["Server-Timing"] = timeline.server_timing()
         
         # Save the conversational response (fallback to reasoning if empty)
         response_to_save = result.data.response or result.data.reasoning or "Processed."
         result.data.response = response_to_save
         
-        await chat_service.add_message(session_id, "assistant", response_to_save)
+        save_turn(chat_service, session_id, request.query, response_to_save)
         
         return {
             "session_id": session_id,
             "data": result.data
         }
         
+    except InferenceQueueFull as e:
+        print(f"[QUERY] Rejected, inference backlog: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         print(f"[ERROR] Query failed: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+@router.post("/stream")
+async def query_compliance_stream(
+    request: QueryRequest,
+    vector_store: VectorStoreService = Depends(get_vector_store),
+    chat_service: ChatHistoryService = Depends(get_chat_service),
+    metadata_filter: Optional[Dict] = Depends(get_metadata_filter)
+):
+    """
+    Server-sent events version of POST /query/. Emits, in order:
+    session -> retrieval -> token* -> final -> done
+    """
+    print(f"[QUERY STREAM] Processing: {request.query}")
+    session_id = request.session_id or str(uuid.uuid4())
+    timeline = RequestTimeline()
+    start_time = timeline.started
+    deps = AgentDeps(vector_store=vector_store)
+
+    # Retrieval happens before the response starts so backpressure can still answer 503
+    try:
+        # A KB intent match is answered without retrieval; otherwise history loads while retrieval runs
+        direct_answer, docs, formatted_history = await _prepare(request, session_id, deps, chat_service, metadata_filter, timeline)
+    except InferenceQueueFull as e:
+        print(f"[QUERY STREAM] Rejected, inference backlog: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        print(f"[ERROR] Stream query failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        yield _sse("session", {"session_id": session_id})
+
+        first_token_at = None
+        final = None
+        with timeline.stage("answer"):
+            async for event, payload in compliance_agent.stream(request.query, docs, deps, formatted_history, direct_answer):
+                if event == "token" and first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    print(f"[QUERY STREAM] Time to first token: {(first_token_at - start_time) * 1000:.0f}ms")
+                if event == "final":
+                    # Save the conversational response (fallback to reasoning if empty)
+                    payload["response"] = payload.get("response") or payload.get("reasoning") or "Processed."
+                    final = payload
+                    yield _sse("final", {"session_id": session_id, "data": payload})
+                else:
+                    yield _sse(event, payload)
+
+        if final is not None:
+            save_turn(chat_service, session_id, request.query, final["response"])
+
+        total_time = time.perf_counter() - start_time
+        print(f"[QUERY STREAM] Completed in {total_time * 1000:.0f}ms. Timeline: {timeline.summary()}")
+        yield _sse("done", {
+            "ttft_ms": round((first_token_at - start_time) * 1000, 1) if first_token_at else None,
+            "total_ms": round(total_time * 1000, 1),
+            "timeline": timeline.as_dict()
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stages up to the start of the stream; the "done" event carries the full timeline
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": timeline.server_timing()}
+    )
@@ -0,0 +1,57 @@
+import asyncio
+from typing import Coroutine, Set
+from loguru import logger
+from app.core.metrics import registry
+
+background_failures = registry.counter(
+    "rag_background_task_failures_total", "Fire-and-forget tasks (e.g. chat history writes) that raised", labelnames=("task",)
+)
+
+
+class BackgroundRunner:
+    """
+    Fire-and-forget work that must not hold up a response, such as persisting a
+    chat turn. Tasks are kept referenced until they finish (the event loop only
+    holds weak references), failures are logged and counted instead of being
+    lost, and shutdown drains whatever is still running.
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine, name: str) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+        return task
+
+    def _finished(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            background_failures.inc(task=task.get_name())
+            logger.opt(exception=error).error(f"Background task {task.get_name()} failed: {error}")
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait for running tasks on shutdown; whatever is left after timeout is cancelled."""
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Cancelled {len(pending)} background tasks still running at shutdown")
+
+
+background_runner = BackgroundRunner()
+
+registry.callback(
+    "rag_background_tasks_pending", "Fire-and-forget tasks still running", "gauge",
+    lambda: [({}, background_runner.pending)]
+)
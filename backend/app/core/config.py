@@ -7,6 +7,113 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:5173", "http://localhost:3000"]
 
+    # Chat model: "groq", or "stub" for a local deterministic model with simulated latency (load tests)
+    LLM_PROVIDER: str = "groq"
+    STUB_LLM_LATENCY_MS: float = 800.0
+
+    # Prompt token budget: retrieved chunks are packed whole into what query and history leave over
+    MAX_INPUT_TOKENS: int = 6000
+    PROMPT_RESERVE_TOKENS: int = 500  # system prompt + format instructions
+    HISTORY_TOKEN_BUDGET: int = 1500
+
+    # Chat history: recent messages loaded per query; older turns are folded into a rolling summary
+    CHAT_HISTORY_MESSAGES: int = 20
+    CHAT_SUMMARY_FOLD_BATCH: int = 10  # fold once this many messages have left the recent window
+    CHAT_SUMMARY_MAX_ITEMS: int = 20
+    # uvicorn worker processes (uvicorn also reads this variable as its --workers default)
+    WEB_CONCURRENCY: int = 1
+    # Per-worker cache of active sessions, only used with WEB_CONCURRENCY=1. "write_through" persists each turn before moving on,
+    # "write_behind" batches writes (flushed every CHAT_FLUSH_INTERVAL_MS and on shutdown)
+    HISTORY_DURABILITY: str = "write_through"
+    CHAT_SESSION_CACHE_SIZE: int = 1024
+    CHAT_SESSION_CACHE_TTL_SECONDS: float = 600.0
+    CHAT_FLUSH_INTERVAL_MS: float = 500.0
+    CHAT_FLUSH_BATCH: int = 200
+    CHAT_MAX_PENDING_MESSAGES: int = 10000
+
+    # Startup: models and index load in the background, then these queries warm them up
+    WARMUP_ENABLED: bool = True
+    WARMUP_QUERIES: List[str] = ["What is a compliance audit?", "How long should customer records be retained?"]
+
+    # Event-loop lag sampling (reported by /health)
+    LOOP_LAG_SAMPLE_INTERVAL_MS: float = 50.0
+
+    # Embedding model and CrossEncoder runtime: "torch" (sentence-transformers) or "onnx" (ONNX Runtime,
+    # models exported by export_onnx.py). "onnx" falls back to torch if the exported models cannot be loaded
+    INFERENCE_BACKEND: str = "torch"
+    ONNX_MODEL_DIR: str = "data/onnx"
+    ONNX_QUANTIZED: bool = True  # serve the int8 models when export_onnx.py produced them
+    ONNX_INTRA_OP_THREADS: int = 0  # threads per model call, 0 = ONNX Runtime default (one per core)
+
+    # Inference executor (query embedding + reranking run off the event loop)
+    INFERENCE_WORKERS: int = 2
+    INFERENCE_MAX_QUEUE_DEPTH: int = 32
+
+    # Cross-request CrossEncoder micro-batching
+    RERANK_BATCHING_ENABLED: bool = True
+    RERANK_MAX_WAIT_MS: float = 5.0
+    RERANK_MAX_BATCH: int = 64
+
+    # Adaptive reranking: skip the CrossEncoder when the dense top-k is clear-cut, rerank fewer candidates
+    # for easy queries, and stop scoring once the top-k settles. 1.0 (default) reranks all k*3 candidates
+    # every time; lower values opt in to saving CrossEncoder work at some cost in ranking quality
+    # (compare with benchmark.py --rerank-quality before lowering it)
+    RERANK_QUALITY: float = 1.0
+
+    # Query embedding cache and cross-request embedding batching
+    QUERY_EMBED_CACHE_SIZE: int = 2048
+    QUERY_EMBED_CACHE_TTL_SECONDS: float = 3600.0
+    EMBED_MAX_WAIT_MS: float = 2.0
+    EMBED_MAX_BATCH: int = 32
+
+    # Golden KB intent index (written by ingest_kb.py): questions matching a KB intent skip retrieval
+    KB_INTENT_MATCH_ENABLED: bool = True
+    KB_INTENT_INDEX_PATH: str = "data/kb_intent_index.json"
+    KB_INTENT_FUZZY_THRESHOLD: float = 0.65  # trigram Jaccard similarity that still counts as a misspelling
+
+    # Semantic answer cache in front of the LLM
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 512
+    ANSWER_CACHE_TTL_SECONDS: float = 1800.0
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+
+    # FAISS index type: "flat" (exact), "hnsw", "ivf" or "ivfpq". Apply changes with rebuild_index.py
+    FAISS_INDEX_TYPE: str = "flat"
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    IVF_NLIST: int = 0  # 0 = derive from corpus size
+    IVF_NPROBE: int = 8
+    PQ_M: int = 48  # sub-quantizers, must divide the embedding dimension (384)
+    PQ_NBITS: int = 8
+
+    # Index partitions: chunks are grouped by (type, source, category) so filtered searches skip the rest.
+    # Partitions up to this many vectors are searched exactly; larger ones through an ID filter on the index
+    INDEX_PARTITION_EXACT_MAX_ROWS: int = 2000
+    INDEX_PARTITION_SEARCH_THREADS: int = 4  # one search per document type runs in parallel
+
+    # Index persistence: new chunks go to an append-only log, merged into the base index in the background
+    INDEX_COMPACTION_THRESHOLD: int = 5000  # logged chunks before a background compaction
+    INDEX_TOMBSTONE_COMPACTION_THRESHOLD: int = 1000  # deleted chunks (over-fetched at search time) before compaction
+    # Index changes made by other processes (workers, ingest_kb.py) are polled for this often; 0 disables
+    INDEX_REFRESH_INTERVAL_SECONDS: float = 2.0
+    # Load (and migrate once) indexes saved with the old pickled docstore. Pickle can execute code on load.
+    ALLOW_LEGACY_PICKLE_INDEX: bool = True
+
+    # PDF ingestion pipeline (extract -> chunk -> embed -> commit)
+    INGEST_PROCESS_WORKERS: int = 0  # page-extraction processes, 0 = cpu_count - 1
+    INGEST_PAGES_PER_TASK: int = 8
+    INGEST_EMBED_BATCH_SIZE: int = 64
+    INGEST_EMBED_THREADS: int = 1
+    INGEST_QUEUE_SIZE: int = 256  # max items buffered between two stages
+
+    # Ingestion jobs
+    INGEST_MAX_CONCURRENT_JOBS: int = 2
+    INGEST_JOB_STORE: str = "mongo"  # "mongo" or "local" (JSON file stand-in)
+    INGEST_JOB_STORE_PATH: str = "data/ingest_jobs.json"
+    INGEST_PROGRESS_INTERVAL_SECONDS: float = 1.0
+    INGEST_RESUME_LOCK_PATH: str = "data/ingest_jobs.lock"  # the worker holding it resumes interrupted jobs
+
     class Config:
         case_sensitive = True
 
@@ -1,5 +1,6 @@
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.memory_db import MemoryClient
 
 class Database:
     client: AsyncIOMotorClient = None
@@ -7,6 +8,13 @@ class Database:
 
     def connect(self):
         mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+
+        if mongo_uri.startswith("memory://"):
+            # In-process stand-in for load tests and offline runs; nothing is persisted
+            self.client = MemoryClient()
+            self.db = self.client["compliance_rag_db"]
+            print("✓ Using in-memory database (MONGODB_URI=memory://)")
+            return
         
         # MongoDB Atlas requires specific connection options
         connection_options = {
@@ -0,0 +1,89 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class InterProcessLock:
+    """
+    Exclusive lock shared by every process that opens the same lock file (flock
+    on POSIX, msvcrt.locking on Windows), re-entrant within a process like an
+    RLock. The OS drops the lock when the holder dies, so a crashed worker never
+    leaves it stuck.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._handle = None
+
+    @property
+    def held(self) -> bool:
+        return self._depth > 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                if not self._lock_file(blocking):
+                    self._thread_lock.release()
+                    return False
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._thread_lock.release()
+
+    def _lock_file(self, blocking: bool) -> bool:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        handle = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                handle.seek(0)
+                # LK_LOCK retries for ~10s before raising; loop for a truly blocking acquire
+                while True:
+                    try:
+                        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+        except OSError:
+            handle.close()
+            if blocking:
+                raise
+            return False
+        self._handle = handle
+        return True
+
+    def _unlock_file(self):
+        handle, self._handle = self._handle, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            handle.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
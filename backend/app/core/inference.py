@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import registry, timed_stage  # timed_stage re-exported for existing imports
+
+
+class InferenceQueueFull(Exception):
+    """Raised when too many inference jobs are already pending."""
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for CPU-bound model inference (embeddings, CrossEncoder).
+
+    Torch and FAISS release the GIL for the heavy work, so running them here keeps
+    the event loop free to serve other requests. Jobs beyond max_queue_depth are
+    rejected with InferenceQueueFull so the API can answer 503 instead of queueing
+    without limit.
+    """
+
+    def __init__(self, max_workers: int, max_queue_depth: int):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self._pending >= self.max_queue_depth:
+                logger.warning(f"Inference queue full ({self._pending} pending), rejecting job")
+                rejected_jobs.inc()
+                raise InferenceQueueFull(
+                    f"Inference queue is full ({self.max_queue_depth} pending jobs). Please retry shortly."
+                )
+            self._pending += 1
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+
+        # Release the slot when the thread actually finishes, not when the caller stops waiting
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor(
+    max_workers=settings.INFERENCE_WORKERS,
+    max_queue_depth=settings.INFERENCE_MAX_QUEUE_DEPTH
+)
+
+rejected_jobs = registry.counter("rag_inference_rejected_total", "Inference jobs rejected because the queue was full")
+registry.callback(
+    "rag_inference_pending", "Inference jobs queued or running", "gauge",
+    lambda: [({}, inference_executor.pending)]
+)
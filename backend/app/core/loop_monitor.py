@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: how late a periodic sleep wakes up. Anything that
+    blocks the loop (sync model calls, big JSON encodes) shows up here as lag.
+
+    Counts are cumulative, in fixed buckets, so callers (e.g. loadtest.py) can
+    diff two snapshots to get the lag distribution over an interval.
+    """
+
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000.0
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.histogram = {bucket: 0 for bucket in self.BUCKETS_MS}
+        self.overflow = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sample())
+
+    async def _sample(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, time.perf_counter() - start - self.interval))
+
+    def _record(self, lag: float):
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        lag_ms = lag * 1000
+        for bucket in self.BUCKETS_MS:
+            if lag_ms <= bucket:
+                self.histogram[bucket] += 1
+                break
+        else:
+            self.overflow += 1
+
+    def stats(self) -> Dict:
+        histogram = {f"le_{bucket}": count for bucket, count in self.histogram.items()}
+        histogram["overflow"] = self.overflow
+        return {
+            "samples": self.samples,
+            "total_lag_ms": round(self.total_lag * 1000, 3),
+            "avg_lag_ms": round(self.total_lag / self.samples * 1000, 3) if self.samples else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "histogram_ms": histogram,
+        }
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+loop_monitor = LoopLagMonitor(settings.LOOP_LAG_SAMPLE_INTERVAL_MS)
+
+registry.callback(
+    "rag_event_loop_lag_seconds_total", "Accumulated event-loop lag across samples", "counter",
+    lambda: [({}, loop_monitor.total_lag)]
+)
+registry.callback(
+    "rag_event_loop_lag_samples_total", "Event-loop lag samples taken", "counter",
+    lambda: [({}, loop_monitor.samples)]
+)
+registry.callback(
+    "rag_event_loop_lag_seconds_max", "Largest event-loop lag seen since start", "gauge",
+    lambda: [({}, loop_monitor.max_lag)]
+)
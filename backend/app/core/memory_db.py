@@ -0,0 +1,179 @@
+import copy
+from typing import Any, Dict, List, Optional, Tuple, Union
+from bson import ObjectId
+
+
+def _matches(document: Dict, query: Dict) -> bool:
+    for key, condition in query.items():
+        value = document.get(key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$gt" and not (value is not None and value > operand):
+                    return False
+                if op == "$gte" and not (value is not None and value >= operand):
+                    return False
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$lte" and not (value is not None and value <= operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(document: Dict, projection: Optional[Dict]) -> Dict:
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    included = {key for key, flag in projection.items() if flag and key != "_id"}
+    if included:
+        document = {key: value for key, value in document.items() if key in included or key == "_id"}
+    for key, flag in projection.items():
+        if not flag:
+            document.pop(key, None)
+    return document
+
+
+def _apply_update(document: Dict, update: Dict):
+    document.update(copy.deepcopy(update.get("$set", {})))
+    for key, amount in update.get("$inc", {}).items():
+        document[key] = document.get(key, 0) + amount
+
+
+class MemoryCursor:
+    def __init__(self, documents: List[Dict], projection: Optional[Dict]):
+        self._documents = documents
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key_or_list: Union[str, List[Tuple[str, int]]], direction: int = 1) -> "MemoryCursor":
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        # Stable sorts applied from the last key to the first give a multi-key sort
+        for key, key_direction in reversed(keys):
+            self._documents.sort(
+                key=lambda doc: (doc.get(key) is not None, doc.get(key)),
+                reverse=key_direction < 0
+            )
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = limit
+        return self
+
+    def _results(self) -> List[Dict]:
+        documents = self._documents[:self._limit] if self._limit else self._documents
+        return [_project(doc, self._projection) for doc in documents]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self) -> Dict:
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Result:
+    def __init__(self, **fields: Any):
+        self.__dict__.update(fields)
+
+
+class MemoryCollection:
+    """The subset of Motor's AsyncIOMotorCollection API the services use."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: List[Dict] = []
+
+    def _insert(self, document: Dict) -> ObjectId:
+        document.setdefault("_id", ObjectId())
+        self._documents.append(copy.deepcopy(document))
+        return document["_id"]
+
+    async def insert_one(self, document: Dict) -> _Result:
+        return _Result(inserted_id=self._insert(document))
+
+    async def insert_many(self, documents: List[Dict], ordered: bool = True) -> _Result:
+        return _Result(inserted_ids=[self._insert(document) for document in documents])
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> MemoryCursor:
+        return MemoryCursor([doc for doc in self._documents if _matches(doc, query or {})], projection)
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[Dict]:
+        for document in self._documents:
+            if _matches(document, query or {}):
+                return _project(document, projection)
+        return None
+
+    async def replace_one(self, query: Dict, replacement: Dict, upsert: bool = False) -> _Result:
+        for i, document in enumerate(self._documents):
+            if _matches(document, query):
+                self._documents[i] = {**copy.deepcopy(replacement), "_id": document["_id"]}
+                return _Result(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            return _Result(matched_count=0, modified_count=0, upserted_id=self._insert(dict(replacement)))
+        return _Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False) -> _Result:
+        for document in self._documents:
+            if _matches(document, query):
+                _apply_update(document, update)
+                return _Result(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            document.update(update.get("$setOnInsert", {}))
+            _apply_update(document, update)
+            return _Result(matched_count=0, modified_count=0, upserted_id=self._insert(document))
+        return _Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def delete_many(self, query: Dict) -> _Result:
+        before = len(self._documents)
+        self._documents = [doc for doc in self._documents if not _matches(doc, query)]
+        return _Result(deleted_count=before - len(self._documents))
+
+    async def count_documents(self, query: Dict) -> int:
+        return sum(1 for doc in self._documents if _matches(doc, query))
+
+    async def create_index(self, keys, **kwargs) -> str:
+        return "_".join(f"{key}_{direction}" for key, direction in keys) if isinstance(keys, list) else f"{keys}_1"
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+
+class MemoryClient:
+    """
+    In-process stand-in for AsyncIOMotorClient, selected with MONGODB_URI=memory://.
+    Data lives only as long as the process; meant for load tests and offline runs.
+    """
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def close(self):
+        pass
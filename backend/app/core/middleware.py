@@ -1,6 +1,18 @@
 import time
 from fastapi import Request
 from loguru import logger
+from app.core.metrics import registry
+
+request_duration = registry.histogram(
+    "rag_http_request_duration_seconds",
+    "HTTP request latency by route",
+    labelnames=("method", "route", "status")
+)
+
+def _route_label(request: Request) -> str:
+    # Route templates (not raw paths) keep the label cardinality bounded
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
 
 async def logging_middleware(request: Request, call_next):
     start_time = time.time()
@@ -11,6 +23,7 @@ async def logging_middleware(request: Request, call_next):
     try:
         response = await call_next(request)
         process_time = time.time() - start_time
+        request_duration.observe(process_time, method=request.method, route=_route_label(request), status=str(response.status_code))
         
         # Log Response
         logger.info(
@@ -21,4 +34,5 @@ async def logging_middleware(request: Request, call_next):
         
     except Exception as e:
         logger.error(f"Request Failed: {str(e)}")
+        request_duration.observe(time.time() - start_time, method=request.method, route=_route_label(request), status="500")
         raise e
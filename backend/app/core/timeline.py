@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple
+from app.core.metrics import timed_stage
+
+
+class Span(NamedTuple):
+    stage: str
+    start: float  # seconds since the request started
+    end: float
+
+
+class RequestTimeline:
+    """
+    When each stage of one request ran, relative to the request start. Stages may
+    overlap (history fetch next to retrieval); the critical path is the chain of
+    stages that actually determined the total latency. Every stage is also
+    recorded in the rag_stage_duration_seconds histogram.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter() - self.started
+        try:
+            with timed_stage(None, name):
+                yield
+        finally:
+            self.spans.append(Span(name, start, time.perf_counter() - self.started))
+
+    def critical_path(self) -> List[str]:
+        """Stages from first to last, each the last one to finish before the next started."""
+        path = []
+        current = max(self.spans, key=lambda span: span.end, default=None)
+        while current is not None:
+            path.append(current.stage)
+            current = max((span for span in self.spans if span.end <= current.start), key=lambda span: span.end, default=None)
+        return path[::-1]
+
+    def as_dict(self) -> Dict:
+        return {
+            "stages": [
+                {"stage": span.stage, "start_ms": round(span.start * 1000, 1), "end_ms": round(span.end * 1000, 1)}
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+            "critical_path": self.critical_path(),
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, shown per request in browser dev tools."""
+        return ", ".join(f"{span.stage};dur={(span.end - span.start) * 1000:.1f}" for span in self.spans)
+
+    def summary(self) -> str:
+        stages = ", ".join(
+            f"{span.stage} {span.start * 1000:.0f}-{span.end * 1000:.0f}ms" for span in sorted(self.spans, key=lambda span: span.start)
+        )
+        return f"{stages} (critical path: {' > '.join(self.critical_path())})"
@@ -1,49 +1,113 @@
 import tiktoken
-from typing import List
+from typing import Dict, List
 from loguru import logger
+from app.core.config import settings
+
+# Every chunk starts with this block (see DocumentProcessor / ingest_kb). It helps
+# retrieval, but in the prompt it only repeats what the source label says.
+CHUNK_HEADER_PREFIX = "DOMARIN:"
+CHUNK_HEADER_END = "\n---\n"
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant", "summary": "Earlier questions in this conversation"}
 
 class TokenManager:
     def __init__(self, model_name: str = "cl100k_base", max_input_tokens: int = 6000):
-        try:
-            self.encoder = tiktoken.get_encoding(model_name)
-        except:
-            self.encoder = tiktoken.get_encoding("cl100k_base")
-        
+        self.model_name = model_name
+        self._encoder = None
         self.max_input_tokens = max_input_tokens
 
+    @property
+    def encoder(self):
+        # Loaded on first use (may download the BPE file), not at import time
+        if self._encoder is None:
+            try:
+                self._encoder = tiktoken.get_encoding(self.model_name)
+            except:
+                self._encoder = tiktoken.get_encoding("cl100k_base")
+        return self._encoder
+
     def count_tokens(self, text: str) -> int:
         if not text:
             return 0
         return len(self.encoder.encode(text))
 
-    def validate_and_truncate(self, history: str, regulatory_context: str, query: str) -> str:
-        query_tokens = self.count_tokens(query)
-        history_tokens = self.count_tokens(history)
-        
-        available_info_tokens = self.max_input_tokens - query_tokens - 500
-        
-        if available_info_tokens < 0:
-            logger.warning("Query is too large! Truncating inputs heavily.")
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encoder.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoder.decode(tokens[:max_tokens]) + " ...[TRUNCATED]"
+
+    @staticmethod
+    def strip_chunk_header(text: str) -> str:
+        if text.startswith(CHUNK_HEADER_PREFIX):
+            header_end = text.find(CHUNK_HEADER_END)
+            if header_end >= 0:
+                return text[header_end + len(CHUNK_HEADER_END):]
+        return text
+
+    def chunk_token_count(self, text: str) -> int:
+        """Tokens of a chunk as it appears in the prompt (header stripped). Stored at ingest."""
+        return self.count_tokens(self.strip_chunk_header(text))
+
+    def fit_history(self, messages: List[Dict], max_tokens: int = None) -> str:
+        """
+        Format chat history newest-first within a token budget, keeping whole
+        turns. Only the most recent turn may be cut if it alone exceeds the budget.
+        """
+        budget = settings.HISTORY_TOKEN_BUDGET if max_tokens is None else max_tokens
+        kept: List[str] = []
+        for message in reversed(messages):
+            line = f"{ROLE_LABELS.get(message['role'], 'Assistant')}: {message['content']}"
+            tokens = self.count_tokens(line) + 1
+            if tokens > budget:
+                if not kept:
+                    kept.append(self.truncate(line, budget))
+                break
+            kept.append(line)
+            budget -= tokens
+        return "\n".join(reversed(kept))
+
+    def pack_context(self, docs: List, history: str, query: str) -> str:
+        """
+        Pack whole chunks, in rank order, into the tokens left after the query,
+        history and prompt overhead. A chunk that does not fit is skipped (a later,
+        smaller one may still fit) rather than cut in half. Token counts come from
+        chunk metadata, so only the short source labels are tokenized per request.
+        """
+        available = self.max_input_tokens - settings.PROMPT_RESERVE_TOKENS - self.count_tokens(query) - self.count_tokens(history)
+        if available <= 0:
+            logger.warning("Query and history exhaust the token budget. Sending no regulatory context.")
             return ""
 
-        current_context_tokens = self.count_tokens(regulatory_context)
-        
-        if history_tokens + current_context_tokens <= available_info_tokens:
-            return f"{history}\n\nRegulatory Documents:\n{regulatory_context}" if history else regulatory_context
+        sections: List[str] = []
+        skipped = 0
+        for doc in docs:
+            body = self.strip_chunk_header(doc.page_content)
+            tokens = doc.metadata.get("token_count")
+            if tokens is None:
+                tokens = self.count_tokens(body)
 
-        logger.info(f"Token Limit Exceeded: {history_tokens + current_context_tokens} > {available_info_tokens}. Truncating...")
+            metadata = doc.metadata
+            label = metadata.get("title") or metadata.get("source") or "Unknown Document"
+            if metadata.get("page") is not None:
+                label += f", page {metadata['page']}"
+            label = f"[{label}]"
+            cost = tokens + self.count_tokens(label) + 2
 
-        remaining_for_context = available_info_tokens - history_tokens
-        
-        if remaining_for_context < 1000:
-            history = history[-2000:]
-            history_tokens = self.count_tokens(history)
-            remaining_for_context = available_info_tokens - history_tokens
+            if cost <= available:
+                sections.append(f"{label}\n{body}")
+                available -= cost
+            elif not sections and doc is docs[0]:
+                # Never send an empty context just because the best chunk is long
+                sections.append(f"{label}\n{self.truncate(body, available - cost + tokens)}")
+                available = 0
+            else:
+                skipped += 1
 
-        encoded_context = self.encoder.encode(regulatory_context)
-        safe_context_tokens = encoded_context[:remaining_for_context]
-        safe_context = self.encoder.decode(safe_context_tokens)
-        
-        return f"{history}\n\nRegulatory Documents:\n{safe_context} ...[TRUNCATED]" if history else safe_context
+        if skipped:
+            logger.info(f"Context packing skipped {skipped} of {len(docs)} chunks that did not fit the token budget")
+        return "\n\n".join(sections)
 
-token_manager = TokenManager()
+token_manager = TokenManager(max_input_tokens=settings.MAX_INPUT_TOKENS)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
+from datetime import datetime
 
 class ComplianceSource(BaseModel):
     document_name: str
@@ -18,7 +19,30 @@ class ComplianceAssessment(BaseModel):
 class QueryRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
+    filters: Optional[Dict[str, Union[str, List[str]]]] = Field(
+        default=None, description="Only search chunks with these type/source/category values, e.g. {\"type\": \"pdf\"}"
+    )
 
 class QueryResponse(BaseModel):
     session_id: str
     data: ComplianceAssessment
+
+class IngestJob(BaseModel):
+    job_id: str
+    filename: str
+    file_path: str
+    status: str = Field(default="queued", description="queued, running, completed or failed")
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    attempts: int = 0
+    total_pages: int = 0
+    pages_parsed: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_committed: int = 0
+    chunks_skipped: int = 0
+    chunks_removed: int = 0
+    elapsed_seconds: float = 0.0
+    pages_per_second: float = 0.0
+    errors: List[str] = Field(default_factory=list)
@@ -0,0 +1,99 @@
+from typing import List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+from app.core.metrics import registry
+from app.services.index_partitions import KB_TYPE
+
+rerank_decisions = registry.counter(
+    "rag_rerank_decisions_total",
+    "Reranked searches by branch: full, trimmed (smaller candidate pool), early_exit (cascade stopped), gap_skip (no CrossEncoder)",
+    labelnames=("branch",)
+)
+rerank_pairs = registry.counter(
+    "rag_rerank_pairs_total", "Candidates per reranked search: retrieved, then actually scored by the CrossEncoder", labelnames=("stage",)
+)
+
+# Thresholds at RERANK_QUALITY=0, in squared L2 distance between normalized embeddings
+# (0 = identical, 4 = opposite). They widen as quality rises and never trigger at 1.0.
+_SKIP_GAP = 0.1
+_CANDIDATE_MARGIN = 0.05
+
+
+class RerankCascade:
+    """
+    Adaptive CrossEncoder pass over the dense candidates of one search.
+
+    - gap skip: when the (k+1)-th candidate is much further than the k-th, the
+      dense top-k is returned as is.
+    - candidate pool: candidates far beyond the k-th are dropped, so clear-cut
+      queries rerank fewer pairs than ambiguous ones. Golden KB entries always stay.
+    - cascade: the pool is scored nearest first, k pairs per call, and scoring
+      stops as soon as a batch leaves the top-k unchanged.
+
+    quality (RERANK_QUALITY) trades CrossEncoder work for ranking quality; 1.0
+    scores every candidate in one call. Drive it with next_batch/add, then result.
+    """
+
+    def __init__(self, candidates_with_scores: Sequence[Tuple[Document, float]], k: int, quality: float):
+        self.k = k
+        quality = min(max(quality, 0.0), 1.0)
+        # Nearest first; appended KB candidates are merged in by distance
+        ranked = sorted(candidates_with_scores, key=lambda item: item[1])
+        self.retrieved = len(ranked)
+        self.scores: List[float] = []
+        self.skipped = self.stopped_early = False
+
+        if quality >= 1.0:
+            self.pool = [doc for doc, _ in ranked]
+            self.batch_size = max(len(self.pool), 1)
+            return
+
+        distances = [distance for _, distance in ranked]
+        boundary = distances[min(k, len(distances)) - 1]
+        if len(distances) > k and distances[k] - boundary >= _SKIP_GAP / (1.0 - quality):
+            self.skipped = True
+            self.pool = [doc for doc, _ in ranked[:k]]
+        else:
+            cutoff = boundary + _CANDIDATE_MARGIN / (1.0 - quality)
+            self.pool = [doc for doc, distance in ranked if distance <= cutoff or doc.metadata.get("type") == KB_TYPE]
+        self.batch_size = max(k, 1)
+
+    @property
+    def done(self) -> bool:
+        return self.skipped or self.stopped_early or len(self.scores) >= len(self.pool)
+
+    def next_batch(self) -> List[Document]:
+        """Candidates to score next; empty once the cascade is done."""
+        if self.done:
+            return []
+        start = len(self.scores)
+        return self.pool[start:start + self.batch_size]
+
+    def add(self, scores: Sequence[float]):
+        """CrossEncoder scores for the batch last returned by next_batch."""
+        previous = self._top_positions() if len(self.scores) >= self.k else None
+        self.scores.extend(float(score) for score in scores)
+        if previous is not None and not self.done and self._top_positions() == previous:
+            self.stopped_early = True
+
+    def _top_positions(self) -> List[int]:
+        return sorted(sorted(range(len(self.scores)), key=lambda i: self.scores[i], reverse=True)[:self.k])
+
+    def result(self) -> List[Document]:
+        """Top-k documents, best first. Records which branch the search took."""
+        if self.skipped:
+            branch = "gap_skip"
+        elif self.stopped_early:
+            branch = "early_exit"
+        elif len(self.pool) < self.retrieved:
+            branch = "trimmed"
+        else:
+            branch = "full"
+        rerank_decisions.inc(branch=branch)
+        rerank_pairs.inc(self.retrieved, stage="retrieved")
+        rerank_pairs.inc(len(self.scores), stage="scored")
+
+        if self.skipped:
+            return self.pool
+        # Unscored candidates are further in dense order than everything scored
+        order = sorted(range(len(self.scores)), key=lambda i: self.scores[i], reverse=True)
+        return [self.pool[i] for i in order[:self.k]]
@@ -2,16 +2,32 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from typing import List, Optional
+import re
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 from pydantic import BaseModel, Field
 
-from langchain_groq import ChatGroq
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from app.services.vector_store import VectorStoreService
+from app.services.vector_store import KB_TYPE, VectorStoreService
+from app.services.index_partitions import allows
 from app.models.schemas import ComplianceAssessment, ComplianceSource
 from app.services.followup_service import followup_service
+from app.services.intent_index import NON_ANSWER_CATEGORIES, intent_index
+from app.services.answer_cache import answer_cache, is_standalone_query
+from app.services.output_repair import parse_assessment
+from app.services.stub_llm import StubChatModel
+from app.core.config import settings
+from app.core.metrics import registry, stage_duration, timed_stage
+from loguru import logger
 import os
+import time
+
+fast_path_hits = registry.counter("rag_fast_path_total", "Answers served directly from a Golden KB entry without the LLM")
+llm_fallbacks = registry.counter("rag_llm_fallback_total", "LLM re-asks because the output could not be parsed or repaired")
+output_parses = registry.counter(
+    "rag_llm_output_parse_total", "LLM outputs by parse outcome (clean, repaired, partial, failed)", labelnames=("outcome",)
+)
 
 class AgentDeps:
     def __init__(self, vector_store: VectorStoreService):
@@ -20,12 +36,11 @@ class AgentDeps:
 from app.core.token_manager import token_manager
 
 class ComplianceAgent:
-    def __init__(self):
-        self.llm = ChatGroq(
-            model="llama-3.3-70b-versatile",
-            api_key=os.getenv("GROQ_API_KEY"),
-            temperature=0.3
-        )
+    def __init__(self, llm: Optional[BaseChatModel] = None):
+        # Any LangChain chat model can be injected (e.g. the offline stub used by benchmark.py).
+        # Otherwise the configured one is built on first use, so importing the app needs no API key.
+        self._llm = llm
+        self._chain = None
         
         self.parser = PydanticOutputParser(pydantic_object=ComplianceAssessment)
         
@@ -77,16 +92,21 @@ Return ONLY valid JSON. Put the concise answer in 'response' field (REQUIRED), d
 
 {format_instructions}""")
         ])
-        
-        self.chain = self.prompt | self.llm | self.parser
-
-    def _extract_json_from_markdown(self, text: str) -> str:
-        """Extract JSON from markdown code blocks if present"""
-        import re
-        json_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
-        match = re.search(json_pattern, text, re.DOTALL)
-        return match.group(1) if match else text
-    
+
+    @property
+    def llm(self) -> BaseChatModel:
+        if self._llm is None:
+            self._llm = _configured_llm()
+        return self._llm
+
+    @property
+    def chain(self):
+        # The raw completion is parsed locally (see output_repair), so a malformed
+        # answer is repaired instead of costing a second LLM call
+        if self._chain is None:
+            self._chain = self.prompt | self.llm
+        return self._chain
+
     def _add_followup_questions(self, result: ComplianceAssessment, docs: list) -> ComplianceAssessment:
         """
         Enrich the response with follow-up questions based on retrieved documents
@@ -121,112 +141,339 @@ Return ONLY valid JSON. Put the concise answer in 'response' field (REQUIRED), d
         
         return result
 
-    async def run(self, query: str, deps: AgentDeps, history_context: str = ""):
-        # Retrieve relevant documents
-        docs = deps.vector_store.search(query, k=5)
-        
+    @staticmethod
+    def _kb_assessment(kb_id: str, kb_title: str, direct_answer: str, followup_questions: List[str]) -> ComplianceAssessment:
+        fast_path_hits.inc()
+        logger.debug(f"[FAST PATH] Returning direct KB answer from {kb_id} with {len(followup_questions)} follow-up questions")
+
+        # Return structured response without LLM call
+        return ComplianceAssessment(
+            response=direct_answer,
+            status=None,
+            reasoning=f"Source: {kb_title} ({kb_id})",
+            relevant_clauses=[],
+            sources=[ComplianceSource(
+                document_name=kb_title,
+                excerpt=direct_answer[:200] + "..." if len(direct_answer) > 200 else direct_answer,
+                relevance_score=1.0
+            )],
+            conversation_type="kb_direct",
+            follow_up_questions=list(followup_questions)
+        )
+
+    def kb_intent_answer(self, query: str, metadata_filter: Optional[Dict[str, Set[str]]] = None) -> Optional[ComplianceAssessment]:
+        """Direct Golden KB answer when the query matches a KB question intent, before any retrieval."""
+        if not settings.KB_INTENT_MATCH_ENABLED or not allows(metadata_filter, "type", KB_TYPE):
+            return None
+        with timed_stage(None, "kb_intent"):
+            match = intent_index.match(query)
+        if match is None:
+            return None
+        kb_id, entry, kind = match
+        if not (allows(metadata_filter, "source", entry.get("source")) and allows(metadata_filter, "category", entry.get("category"))):
+            return None
+        logger.debug(f"[FAST PATH] Query matched a {kb_id} intent ({kind})")
+        return self._kb_assessment(kb_id, entry["title"], entry["answer"], entry["follow_up_questions"])
+
+    @staticmethod
+    def _is_follow_up(query: str, history_context: str) -> bool:
+        """A query that only makes sense with the earlier turns: no KB fast path or cached answer applies."""
+        return bool(history_context) and not is_standalone_query(query)
+
+    def _kb_direct_answer(self, docs: list) -> Optional[ComplianceAssessment]:
+        """Build the direct Golden KB answer when the top document is a KB entry."""
         # FAST PATH: Check if top result is a Golden KB entry
         # If so, return direct answer without LLM processing
         if docs and len(docs) > 0:
             top_doc = docs[0]
-            is_kb_entry = top_doc.metadata.get("type") == "kb_entry"
+            # Entries such as the output schema instruct the agent; they are never an answer
+            is_kb_entry = (top_doc.metadata.get("type") == "kb_entry"
+                           and top_doc.metadata.get("category") not in NON_ANSWER_CATEGORIES)
             
             if is_kb_entry:
-                # Extract the structured content from the KB entry
-                content = top_doc.page_content
-                
+                kb_id = top_doc.metadata.get("id", "Unknown")
+                kb_title = top_doc.metadata.get("title", "Knowledge Base Entry")
+
+                # Answer and follow-ups were extracted by ingest_kb.py
+                entry = intent_index.entry(kb_id)
+                if entry is not None:
+                    return self._kb_assessment(kb_id, kb_title, entry["answer"], entry["follow_up_questions"])
+
                 # Parse out the CONTENT section (the actual answer)
-                import re
-                content_match = re.search(r'CONTENT:\s*(.+?)(?=\n\n[A-Z_]+:|$)', content, re.DOTALL)
+                content_match = re.search(r'CONTENT:\s*(.+?)(?=\n\n[A-Z_]+:|$)', top_doc.page_content, re.DOTALL)
                 
                 if content_match:
-                    direct_answer = content_match.group(1).strip()
-                    kb_id = top_doc.metadata.get("id", "Unknown")
-                    kb_title = top_doc.metadata.get("title", "Knowledge Base Entry")
-                    
                     # Get follow-up questions for this KB entry
                     followup_questions = followup_service.get_followup_questions(kb_id, max_questions=3)
-                    
-                    print(f"[FAST PATH] Returning direct KB answer from {kb_id} with {len(followup_questions)} follow-up questions")
-                    
-                    # Return structured response without LLM call
-                    return type('obj', (object,), {'data': ComplianceAssessment(
-                        response=direct_answer,
-                        status=None,
-                        reasoning=f"Source: {kb_title} ({kb_id})",
-                        relevant_clauses=[],
-                        sources=[ComplianceSource(
-                            document_name=kb_title,
-                            excerpt=direct_answer[:200] + "..." if len(direct_answer) > 200 else direct_answer,
-                            relevance_score=1.0
-                        )],
-                        conversation_type="kb_direct",
-                        follow_up_questions=followup_questions
-                    )})
-        
-        # STANDARD PATH: Continue with LLM processing
-        context_str = "\n".join([d.page_content for d in docs])
-        
-        # Validate and manage token limits
-        final_context = token_manager.validate_and_truncate(
-            history=history_context, 
-            regulatory_context=context_str, 
-            query=query
-        )
+                    return self._kb_assessment(kb_id, kb_title, content_match.group(1).strip(), followup_questions)
+        return None
+
+    async def _check_answer_cache(self, query: str, docs: list, deps: AgentDeps, history_context: str):
+        """
+        Returns (query_vector, cached_assessment). query_vector is None when the
+        cache is disabled or bypassed, in which case the answer must not be stored.
+        """
+        # SEMANTIC CACHE: Reuse a recent answer for a near-identical question over the same chunks.
+        # Follow-ups that depend on earlier turns always go to the LLM.
+        if not settings.ANSWER_CACHE_ENABLED:
+            return None, None
+        if self._is_follow_up(query, history_context):
+            answer_cache.record_bypass()
+            return None, None
+
+        # Already embedded during retrieval, so this is a query-embedding cache hit
+        query_vector = (await deps.vector_store.aembed_queries([query]))[0]
+        cached = answer_cache.lookup(query_vector, docs, deps.vector_store.generation)
+        if cached is not None:
+            logger.debug("[ANSWER CACHE] Returning cached answer")
+        return query_vector, cached
+
+    def _build_chain_inputs(self, query: str, docs: list, history_context: str) -> dict:
+        # History has its own prompt slot (already budgeted turn by turn), so the
+        # context is only the retrieved chunks, packed whole in rerank order
+        with timed_stage(None, "token_budget"):
+            final_context = token_manager.pack_context(docs, history_context, query)
 
         if not final_context.strip():
              final_context = "No specific regulatory documents were found. Provide a helpful response based on general knowledge."
 
+        return {
+            "query": query,
+            "context": final_context,
+            "history_context": history_context if history_context else "Start of conversation.",
+            "format_instructions": self.parser.get_format_instructions()
+        }
+
+    def _parse_completion(self, completion) -> Tuple[Optional[ComplianceAssessment], str]:
+        """
+        Parse (and if needed repair) a raw completion into (assessment, outcome).
+        The assessment is None when nothing usable could be recovered.
+        """
+        content = completion.content if hasattr(completion, 'content') else str(completion)
+        with timed_stage(None, "parse"):
+            try:
+                data, outcome = parse_assessment(content)
+            except ValueError as e:
+                output_parses.inc(outcome="failed")
+                logger.warning(f"Unparseable LLM output ({e}): {content[:200]!r}")
+                return None, "failed"
+        output_parses.inc(outcome=outcome)
+        if outcome != "clean":
+            logger.info(f"LLM output needed {outcome} repair")
+        return data, outcome
+
+    @staticmethod
+    def _error_assessment(error: Exception) -> ComplianceAssessment:
+        return ComplianceAssessment(
+            response=f"System Error: {str(error)}",  # Show the actual error!
+            status="Needs Review",
+            conversation_type="error"
+        )
+
+    async def retrieve(self, query: str, deps: AgentDeps, metadata_filter: Optional[Dict[str, Set[str]]] = None) -> list:
+        # Retrieve relevant documents
+        return await deps.vector_store.asearch(query, k=5, metadata_filter=metadata_filter)
+
+    async def prepare(self, query: str, deps: AgentDeps, metadata_filter: Optional[Dict[str, Set[str]]] = None,
+                      match_intents: bool = True) -> Tuple[Optional[ComplianceAssessment], list]:
+        """
+        (KB intent answer, retrieved documents): the part of a query that does not
+        depend on the conversation history, so callers can load history meanwhile.
+        Pass match_intents=False for a follow-up that leans on the history ("is this
+        compliant"): its wording says nothing about which KB entry it is about.
+        """
+        # Questions worded like a Golden KB intent never reach the embedding model
+        direct_answer = self.kb_intent_answer(query, metadata_filter) if match_intents else None
+        if direct_answer is not None:
+            return direct_answer, []
+        return None, await self.retrieve(query, deps, metadata_filter)
+
+    async def run(self, query: str, deps: AgentDeps, history_context: str = "", docs: Optional[list] = None,
+                  metadata_filter: Optional[Dict[str, Set[str]]] = None,
+                  direct_answer: Optional[ComplianceAssessment] = None):
+        """docs and direct_answer, when given, are the result of prepare."""
+        if direct_answer is not None:
+            return type('obj', (object,), {'data': direct_answer})
+        if docs is None:
+            direct_answer, docs = await self.prepare(query, deps, metadata_filter, not self._is_follow_up(query, history_context))
+            if direct_answer is not None:
+                return type('obj', (object,), {'data': direct_answer})
+        
+        direct_answer = None if self._is_follow_up(query, history_context) else self._kb_direct_answer(docs)
+        if direct_answer is not None:
+            return type('obj', (object,), {'data': direct_answer})
+        
+        query_vector, cached = await self._check_answer_cache(query, docs, deps, history_context)
+        if cached is not None:
+            return type('obj', (object,), {'data': cached})
+
+        # STANDARD PATH: Continue with LLM processing
+        inputs = self._build_chain_inputs(query, docs, history_context)
+
+        llm_start = time.perf_counter()
         try:
-            # Standard execution flow
-            result = await self.chain.ainvoke({
-                "query": query,
-                "context": final_context,
-                "history_context": history_context if history_context else "Start of conversation.",
-                "format_instructions": self.parser.get_format_instructions()
-            })
+            # Standard execution flow: one LLM call, parsed and repaired locally
+            with timed_stage(None, "llm"):
+                completion = await self.chain.ainvoke(inputs)
+            result, outcome = self._parse_completion(completion)
+
+            if result is None:
+                # Last resort: not even the response field was recoverable, ask once more
+                llm_fallbacks.inc()
+                with timed_stage(None, "llm_fallback"):
+                    completion = await self.chain.ainvoke(inputs)
+                result, outcome = self._parse_completion(completion)
+                if result is None:
+                    raise ValueError("LLM returned unparseable output twice")
             
             # Add follow-up questions to the result
             result = self._add_followup_questions(result, docs)
             
+            # A partial answer is served once but never cached: the next ask may parse cleanly
+            if query_vector is not None and outcome != "partial":
+                answer_cache.store(query_vector, docs, deps.vector_store.generation, result, time.perf_counter() - llm_start)
+            
             return type('obj', (object,), {'data': result})
             
-        except Exception:
-            # Clean single fallback layer for Markdown/JSON issues
-            try:
-                raw_chain = self.prompt | self.llm
-                raw_res = await raw_chain.ainvoke({
-                    "query": query,
-                    "context": final_context,
-                    "history_context": history_context,
-                    "format_instructions": self.parser.get_format_instructions()
-                })
-                
-                content = raw_res.content if hasattr(raw_res, 'content') else str(raw_res)
-                cleaned_json = self._extract_json_from_markdown(content)
-                
-                import json
-                parsed = json.loads(cleaned_json)
-                
-                # Create object from dict
-                data = ComplianceAssessment(**parsed)
-                
-                # Add follow-up questions
-                data = self._add_followup_questions(data, docs)
-                
-                return type('obj', (object,), {'data': data})
-                
-            except Exception as e:
-                print(f"Agent Error: {e}")
-                import traceback
-                traceback.print_exc()
-                # Final safe return to prevent server crash
-                return type('obj', (object,), {'data': ComplianceAssessment(
-                    response=f"System Error: {str(e)}",  # Show the actual error!
-                    status="Needs Review",
-                    conversation_type="error"
-                )})
+        except Exception as e:
+            print(f"Agent Error: {e}")
+            import traceback
+            traceback.print_exc()
+            # Final safe return to prevent server crash
+            return type('obj', (object,), {'data': self._error_assessment(e)})
 
-compliance_agent = ComplianceAgent()
+    async def stream(self, query: str, docs: list, deps: AgentDeps, history_context: str = "",
+                     direct_answer: Optional[ComplianceAssessment] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Streaming variant of run. Yields (event, payload) tuples:
+
+        - "retrieval": the retrieved sources, before any LLM work
+        - "token": incremental text of the 'response' field as the LLM generates it
+        - "final": the complete ComplianceAssessment once the output is parsed
+
+        direct_answer is a KB intent answer found before retrieval (docs is then empty).
+        """
+        if direct_answer is not None:
+            yield "retrieval", {"sources": [
+                {"document_name": source.document_name, "type": "kb_entry", "excerpt": source.excerpt}
+                for source in direct_answer.sources
+            ]}
+        else:
+            yield "retrieval", {"sources": [
+                {
+                    "document_name": doc.metadata.get("title") or doc.metadata.get("source", "Unknown Document"),
+                    "type": doc.metadata.get("type"),
+                    "excerpt": doc.page_content[:200]
+                }
+                for doc in docs
+            ]}
+            direct_answer = None if self._is_follow_up(query, history_context) else self._kb_direct_answer(docs)
+
+        query_vector = None
+        if direct_answer is None:
+            query_vector, direct_answer = await self._check_answer_cache(query, docs, deps, history_context)
+
+        if direct_answer is not None:
+            yield "token", {"text": direct_answer.response or ""}
+            yield "final", direct_answer.model_dump()
+            return
 
+        inputs = self._build_chain_inputs(query, docs, history_context)
+        extractor = _ResponseFieldExtractor()
+        raw_chunks = []
 
+        llm_start = time.perf_counter()
+        try:
+            async for chunk in self.chain.astream(inputs):
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if not text:
+                    continue
+                raw_chunks.append(text)
+                delta = extractor.feed(text)
+                if delta:
+                    yield "token", {"text": delta}
+            stage_duration.observe(time.perf_counter() - llm_start, stage="llm_stream")
+
+            data, outcome = self._parse_completion("".join(raw_chunks))
+            if data is None:
+                raise ValueError("LLM returned unparseable output")
+
+            data = self._add_followup_questions(data, docs)
+            if query_vector is not None and outcome != "partial":
+                answer_cache.store(query_vector, docs, deps.vector_store.generation, data, time.perf_counter() - llm_start)
+
+        except Exception as e:
+            print(f"Agent Stream Error: {e}")
+            data = self._error_assessment(e)
+
+        yield "final", data.model_dump()
+
+
+class _ResponseFieldExtractor:
+    """Incrementally decodes the JSON string value of the "response" key from streamed LLM output."""
+
+    _FIELD_START = re.compile(r'"response"\s*:\s*"')
+    _ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None
+        self._done = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self._done:
+            return ""
+
+        if self._pos is None:
+            match = self._FIELD_START.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buffer, i, out = self._buffer, self._pos, []
+        while i < len(buffer):
+            char = buffer[i]
+            if char == "\\":
+                # Wait for the rest of the escape sequence before decoding it
+                if i + 1 >= len(buffer):
+                    break
+                escaped = buffer[i + 1]
+                if escaped == "u":
+                    if i + 6 > len(buffer):
+                        break
+                    try:
+                        out.append(chr(int(buffer[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                    continue
+                out.append(self._ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+            if char == '"':
+                self._done = True
+                i += 1
+                break
+            out.append(char)
+            i += 1
+
+        self._pos = i
+        return "".join(out)
+
+
+def _configured_llm() -> BaseChatModel:
+    if settings.LLM_PROVIDER == "stub":
+        print(f"[AGENT] Using stub chat model ({settings.STUB_LLM_LATENCY_MS:.0f}ms simulated latency)")
+        return StubChatModel(latency_ms=settings.STUB_LLM_LATENCY_MS)
+    # Imported here: only the groq provider needs the Groq SDK
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model="llama-3.3-70b-versatile",
+        api_key=os.getenv("GROQ_API_KEY"),
+        temperature=0.3
+    )
+
+
+compliance_agent = ComplianceAgent()
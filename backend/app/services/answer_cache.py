@@ -0,0 +1,178 @@
+import hashlib
+import itertools
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.core.metrics import registry
+from app.models.schemas import ComplianceAssessment
+
+# Queries that lean on earlier turns ("tell me more", "what about it") cannot be answered from a cache
+_CONTEXT_DEPENDENT = re.compile(
+    r"^(and|but|also|so|what about|how about|tell me more|elaborate|continue|go on)\b"
+    r"|\b(it|its|this|that|these|those|they|them|their|above|previous|earlier|same|more)\b"
+)
+
+
+def is_standalone_query(query: str) -> bool:
+    """Heuristic: does the query make sense without the conversation history?"""
+    normalized = " ".join(query.lower().split())
+    if len(normalized.split()) < 3:
+        return False
+    return not _CONTEXT_DEPENDENT.search(normalized)
+
+
+def chunk_set_key(docs: List[Document]) -> str:
+    """Stable hash of the retrieved chunk identities (order-insensitive)."""
+    ids = []
+    for doc in docs:
+        chunk_id = doc.metadata.get("chunk_id")
+        if not chunk_id:
+            source = doc.metadata.get("source", "")
+            chunk_id = hashlib.sha1(f"{source}\x00{doc.page_content}".encode("utf-8")).hexdigest()
+        ids.append(chunk_id)
+    return hashlib.sha1("\x00".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+
+class _CachedAnswer:
+    __slots__ = ("vector", "chunk_key", "assessment", "llm_latency", "expires_at")
+
+    def __init__(self, vector: np.ndarray, chunk_key: str, assessment: ComplianceAssessment, llm_latency: float, expires_at: float):
+        self.vector = vector
+        self.chunk_key = chunk_key
+        self.assessment = assessment
+        self.llm_latency = llm_latency
+        self.expires_at = expires_at
+
+
+class SemanticAnswerCache:
+    """
+    Caches LLM answers keyed on (query embedding, retrieved chunk set).
+
+    A lookup hits when an entry for the same chunk set has cosine similarity
+    above the threshold. Entries expire after a TTL, the least recently used
+    entry is evicted when full, and everything is dropped when the vector
+    store generation changes (i.e. documents were added).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[int, _CachedAnswer]" = OrderedDict()
+        self._by_chunk_key: Dict[str, List[int]] = {}
+        self._ids = itertools.count()
+        self._generation = None
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidations = 0
+        self.saved_latency_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_generation(self, generation: int):
+        if self._generation != generation:
+            if self._entries:
+                self.invalidations += 1
+            self.invalidate()
+            self._generation = generation
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket = self._by_chunk_key.get(entry.chunk_key, [])
+        if entry_id in bucket:
+            bucket.remove(entry_id)
+        if not bucket:
+            self._by_chunk_key.pop(entry.chunk_key, None)
+
+    def lookup(self, query_vector, docs: List[Document], generation: int) -> Optional[ComplianceAssessment]:
+        self._check_generation(generation)
+        chunk_key = chunk_set_key(docs)
+        vector = self._normalize(query_vector)
+        now = time.monotonic()
+
+        best_id, best_similarity = None, self.similarity_threshold
+        for entry_id in list(self._by_chunk_key.get(chunk_key, [])):
+            entry = self._entries[entry_id]
+            if entry.expires_at < now:
+                self._remove(entry_id)
+                continue
+            similarity = float(np.dot(vector, entry.vector))
+            if similarity >= best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        entry = self._entries[best_id]
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        self.saved_latency_seconds += entry.llm_latency
+        # Callers mutate the result (e.g. response fallback), so never hand out the cached object
+        return entry.assessment.model_copy(deep=True)
+
+    def store(self, query_vector, docs: List[Document], generation: int, assessment: ComplianceAssessment, llm_latency: float):
+        self._check_generation(generation)
+        chunk_key = chunk_set_key(docs)
+        entry_id = next(self._ids)
+        self._entries[entry_id] = _CachedAnswer(
+            vector=self._normalize(query_vector),
+            chunk_key=chunk_key,
+            assessment=assessment.model_copy(deep=True),
+            llm_latency=llm_latency,
+            expires_at=time.monotonic() + self.ttl_seconds
+        )
+        self._by_chunk_key.setdefault(chunk_key, []).append(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def invalidate(self):
+        self._entries.clear()
+        self._by_chunk_key.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.ANSWER_CACHE_ENABLED,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_seconds": round(self.saved_latency_seconds, 3),
+        }
+
+
+answer_cache = SemanticAnswerCache(
+    max_entries=settings.ANSWER_CACHE_SIZE,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD
+)
+
+registry.callback(
+    "rag_answer_cache_lookups_total", "Semantic answer cache lookups", "counter",
+    lambda: [
+        ({"result": "hit"}, answer_cache.hits),
+        ({"result": "miss"}, answer_cache.misses),
+        ({"result": "bypass"}, answer_cache.bypassed),
+    ],
+    labelnames=("result",)
+)
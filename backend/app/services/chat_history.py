@@ -1,22 +1,302 @@
+import asyncio
 from app.core.database import db
-from typing import List, Dict
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.metrics import registry
+from collections import Counter
+from typing import List, Dict, Optional
 from datetime import datetime
+from bson import ObjectId
+from loguru import logger
+
+# Messages of one turn share a timestamp; the (client-generated, increasing) _id keeps them in order
+NEWEST_FIRST = [("timestamp", -1), ("_id", -1)]
+OLDEST_FIRST = [("timestamp", 1), ("_id", 1)]
+SUMMARY_QUESTION_CHARS = 200
+
+flushes = registry.counter(
+    "rag_chat_history_flushes_total", "Write-behind flushes of chat messages to MongoDB", labelnames=("outcome",)
+)
+
+
+def _fold_questions(summary: str, messages: List[Dict]) -> str:
+    """Rolling summary update: append the user questions of messages leaving the recent window."""
+    items = [line for line in summary.split("\n") if line]
+    for message in messages:
+        if message["role"] == "user":
+            question = " ".join(message["content"].split())
+            if len(question) > SUMMARY_QUESTION_CHARS:
+                question = question[:SUMMARY_QUESTION_CHARS] + "..."
+            items.append(f"- {question}")
+    return "\n".join(items[-settings.CHAT_SUMMARY_MAX_ITEMS:])
+
+
+def _fold_count(unsummarized: int) -> int:
+    """
+    How many of the oldest unsummarized messages to fold into the summary now. Folds
+    happen in batches, so the summary is rewritten every few turns, not on every
+    write. The cache and MongoDB use the same rule, so a reloaded session matches.
+    """
+    overflow = unsummarized - settings.CHAT_HISTORY_MESSAGES
+    return overflow if overflow >= settings.CHAT_SUMMARY_FOLD_BATCH else 0
+
+
+def _fold_entry(entry: Dict):
+    count = _fold_count(len(entry["messages"]))
+    if count:
+        entry["summary"] = _fold_questions(entry["summary"], entry["messages"][:count])
+        del entry["messages"][:count]
+
 
 class ChatHistoryService:
+    """
+    Chat transcripts in MongoDB behind a per-worker LRU cache of active sessions.
+
+    Reads of a cached session never touch MongoDB. The cache is per process, so
+    it is only used when a single worker serves the app (WEB_CONCURRENCY=1);
+    with several workers every read loads the session from MongoDB. Turns are staged first (visible
+    to reads at once, cached or not) and then, depending on HISTORY_DURABILITY:
+      write_through  persist before persist_turn returns
+      write_behind   queue and persist in batches (every CHAT_FLUSH_INTERVAL_MS or
+                     CHAT_FLUSH_BATCH messages, and on shutdown). A crash loses
+                     at most the queued messages.
+    """
+
     def __init__(self):
-        self.collection = db.db["chat_history"]
-
-    async def add_message(self, session_id: str, role: str, content: str):
-        message = {
-            "session_id": session_id,
-            "role": role,
-            "content": content,
-            "timestamp": datetime.utcnow()
-        }
-        await self.collection.insert_one(message)
-
-    async def get_history(self, session_id: str, limit: int = 20) -> List[Dict]:
-        """Retrieve conversation history with increased context window"""
-        cursor = self.collection.find({"session_id": session_id}).sort("timestamp", 1).limit(limit)
-        history = await cursor.to_list(length=limit)
-        return [{"role": msg["role"], "content": msg["content"]} for msg in history]
+        # Another worker would keep serving its own stale copy of a session after this one writes
+        cache_size = settings.CHAT_SESSION_CACHE_SIZE if settings.WEB_CONCURRENCY <= 1 else 0
+        self.sessions = LRUCache(cache_size, settings.CHAT_SESSION_CACHE_TTL_SECONDS)
+        self.write_behind = settings.HISTORY_DURABILITY == "write_behind"
+        self._pending: List[Dict] = []
+        self._in_flight: List[Dict] = []
+        # Write-through messages whose insert has not finished yet
+        self._writing: List[Dict] = []
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop = None
+        self._register_metrics()
+
+    @property
+    def collection(self):
+        return db.db["chat_history"]
+
+    @property
+    def summaries(self):
+        # One rolling summary per session of the turns that fell out of the recent window
+        return db.db["chat_summaries"]
+
+    def _register_metrics(self):
+        registry.callback(
+            "rag_chat_session_cache_lookups_total", "Chat session cache lookups", "counter",
+            lambda: [({"result": "hit"}, self.sessions.hits), ({"result": "miss"}, self.sessions.misses)],
+            labelnames=("result",)
+        )
+        registry.callback(
+            "rag_chat_history_pending_messages", "Chat messages waiting for a write-behind flush", "gauge",
+            lambda: [({}, len(self._pending) + len(self._in_flight))]
+        )
+
+    async def ensure_indexes(self):
+        """Called once at startup. Every history read is an equality on session_id plus a timestamp range/sort."""
+        await self.collection.create_index([("session_id", 1), ("timestamp", -1), ("_id", -1)], name="session_recent")
+        await self.summaries.create_index([("session_id", 1)], name="session", unique=True)
+
+    def stage_turn(self, session_id: str, query: str, response: str) -> List[Dict]:
+        """
+        Make a user/assistant exchange visible to reads right away, before it is
+        written. Synchronous, so a turn staged before its write is scheduled can
+        never be missed by the session's next question. Pass the result to persist_turn.
+        """
+        now = datetime.utcnow()
+        messages = [
+            {"_id": ObjectId(), "session_id": session_id, "role": "user", "content": query, "timestamp": now},
+            {"_id": ObjectId(), "session_id": session_id, "role": "assistant", "content": response, "timestamp": now},
+        ]
+        # Reads that load the session from MongoDB merge these lists in
+        (self._pending if self.write_behind else self._writing).extend(messages)
+        self._remember(session_id, messages)
+        return messages
+
+    async def persist_turn(self, session_id: str, messages: List[Dict]):
+        """Write a staged turn: now (write-through) or with the next batch (write-behind)."""
+        if self.write_behind:
+            self._ensure_flusher()
+            if len(self._pending) >= settings.CHAT_FLUSH_BATCH:
+                self._wake.set()
+            return
+
+        try:
+            await self._persist(messages)
+        except Exception as e:
+            logger.error(f"Failed to persist chat history for session {session_id}: {e}")
+            # The cache may hold messages MongoDB does not: reload the session on its next read
+            self.sessions.delete(session_id)
+        finally:
+            self._writing = [message for message in self._writing if all(message is not m for m in messages)]
+
+    async def add_turn(self, session_id: str, query: str, response: str):
+        """Record a user/assistant exchange (stage_turn, then persist_turn)."""
+        await self.persist_turn(session_id, self.stage_turn(session_id, query, response))
+
+    async def get_history(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        The messages not yet folded into the rolling summary (the recent window plus
+        fewer than CHAT_SUMMARY_FOLD_BATCH older ones), or the most recent `limit`,
+        in chronological order, preceded by the summary when there is one.
+        """
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            entry = await self._load(session_id)
+            self.sessions.put(session_id, entry)
+
+        messages = entry["messages"][-limit:] if limit else entry["messages"]
+        history = [{"role": message["role"], "content": message["content"]} for message in messages]
+        if entry["summary"]:
+            history.insert(0, {"role": "summary", "content": entry["summary"]})
+        return history
+
+    async def _load(self, session_id: str) -> Dict:
+        """
+        Two indexed lookups regardless of session length: the summary, then every
+        message after the last one it covers. Messages not written yet are merged in.
+        """
+        state = await self.summaries.find_one(
+            {"session_id": session_id}, {"_id": 0, "summary": 1, "summarized_until": 1, "summarized_id": 1}
+        ) or {}
+        # Fewer than this are unsummarized after any completed write
+        limit = settings.CHAT_HISTORY_MESSAGES + settings.CHAT_SUMMARY_FOLD_BATCH
+        cursor = self.collection.find(
+            self._unsummarized_query(session_id, state), {"role": 1, "content": 1, "timestamp": 1}
+        ).sort(NEWEST_FIRST).limit(limit)
+        messages = await cursor.to_list(length=limit)
+
+        stored = {message["_id"] for message in messages}
+        messages += [
+            message for message in self._writing + self._in_flight + self._pending
+            if message["session_id"] == session_id and message["_id"] not in stored
+        ]
+        messages.sort(key=lambda message: (message["timestamp"], message["_id"]))
+        entry = {"summary": state.get("summary") or "", "messages": [self._cached(message) for message in messages]}
+        # Messages MongoDB has not counted yet may already be due for folding
+        _fold_entry(entry)
+        return entry
+
+    @staticmethod
+    def _unsummarized_query(session_id: str, state: Dict) -> Dict:
+        query = {"session_id": session_id}
+        if state.get("summarized_until"):
+            # The timestamp bound uses the index; _id breaks ties within the last folded turn
+            query["timestamp"] = {"$gte": state["summarized_until"]}
+            query["_id"] = {"$gt": state["summarized_id"]}
+        return query
+
+    @staticmethod
+    def _cached(message: Dict) -> Dict:
+        return {"_id": message["_id"], "role": message["role"], "content": message["content"]}
+
+    def _remember(self, session_id: str, messages: List[Dict]):
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            return  # the next read loads it from MongoDB, merged with the staged messages
+
+        # A read that ran after the write may already have loaded these messages
+        cached = {message["_id"] for message in entry["messages"]}
+        entry["messages"].extend(self._cached(message) for message in messages if message["_id"] not in cached)
+        _fold_entry(entry)
+
+    async def _persist(self, messages: List[Dict]):
+        await self.collection.insert_many(messages, ordered=True)
+        for session_id, count in Counter(message["session_id"] for message in messages).items():
+            try:
+                await self._count_messages(session_id, count)
+            except Exception as e:
+                logger.warning(f"Failed to update chat summary for session {session_id}: {e}")
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._flusher is None or self._flusher.done() or self._loop is not loop:
+            self._loop = loop
+            self._flush_lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            self._flusher = loop.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.CHAT_FLUSH_INTERVAL_MS / 1000.0)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Persist every queued message in one ordered bulk insert; failed messages are retried next time."""
+        if not self._pending:
+            return
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            self._in_flight, self._pending = self._pending, []
+            try:
+                await self._persist(self._in_flight)
+                flushes.inc(outcome="ok")
+            except Exception as e:
+                flushes.inc(outcome="failed")
+                # An ordered insert stops at the first failure; everything before it was written
+                inserted = (getattr(e, "details", None) or {}).get("nInserted", 0)
+                retry = self._in_flight[inserted:] + self._pending
+                dropped = max(0, len(retry) - settings.CHAT_MAX_PENDING_MESSAGES)
+                if dropped:
+                    logger.error(f"Dropping {dropped} unflushed chat messages, write-behind queue is full")
+                self._pending = retry[dropped:]
+                logger.error(f"Chat history flush failed, {len(self._pending)} messages queued for retry: {e}")
+            finally:
+                self._in_flight = []
+
+    async def close(self):
+        """Stop the flusher and write out everything still queued (lifespan shutdown)."""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        self._flusher = None
+        await self.flush()
+
+    async def _count_messages(self, session_id: str, count: int):
+        await self.summaries.update_one(
+            {"session_id": session_id},
+            {"$inc": {"message_count": count}, "$setOnInsert": {"summarized_count": 0, "summary": ""}},
+            upsert=True
+        )
+        state = await self.summaries.find_one({"session_id": session_id})
+        count = _fold_count(state["message_count"] - state["summarized_count"])
+        if count:
+            await self._fold(state, count)
+
+    async def _fold(self, state: Dict, count: int):
+        """Move the oldest unsummarized messages into the rolling summary (extractive: the questions asked)."""
+        query = self._unsummarized_query(state["session_id"], state)
+        cursor = self.collection.find(query, {"role": 1, "content": 1, "timestamp": 1}).sort(OLDEST_FIRST).limit(count)
+        messages = await cursor.to_list(length=count)
+        if not messages:
+            return
+
+        await self.summaries.update_one(
+            {"session_id": state["session_id"]},
+            {
+                "$set": {
+                    "summary": _fold_questions(state.get("summary", ""), messages),
+                    "summarized_until": messages[-1]["timestamp"],
+                    "summarized_id": messages[-1]["_id"],
+                    "updated_at": datetime.utcnow()
+                },
+                "$inc": {"summarized_count": len(messages)}
+            }
+        )
+
+
+chat_history_service = ChatHistoryService()
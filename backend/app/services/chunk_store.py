@@ -0,0 +1,245 @@
+import json
+import mmap
+import os
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# Dictionary-encoded string columns and integer columns kept out of the per-row JSON
+STRING_COLUMNS = ("source", "type", "id", "category", "title")
+INT_COLUMNS = ("page", "token_count")
+MISSING = -1
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped snapshot of chunk text and metadata.
+
+    Files in the snapshot directory:
+      text.bin / text.offsets.npy    UTF-8 blob of all chunk texts + int64 offsets (n + 1)
+      meta.<col>.npy + meta.dict.json  int32 codes into a per-column vocabulary
+      meta.<col>.npy (INT_COLUMNS)    int32 values, -1 when missing
+      extra.bin / extra.offsets.npy   JSON of any other metadata keys (empty when none)
+      ids.npy, ids.sorted.npy, ids.order.npy  docstore ids in row order, plus a sorted copy for lookups
+
+    Everything is opened with mmap, so uvicorn workers share the pages through the
+    OS page cache and only touch the rows they actually read. Nothing is unpickled.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._text_offsets = np.load(self._path("text.offsets.npy"), mmap_mode="r")
+        self._extra_offsets = np.load(self._path("extra.offsets.npy"), mmap_mode="r")
+        self._text = self._map_blob("text.bin")
+        self._extra = self._map_blob("extra.bin")
+
+        with open(self._path("meta.dict.json"), 'r', encoding='utf-8') as f:
+            self._vocab: Dict[str, List[str]] = json.load(f)
+        self._columns = {column: self._load_column(column) for column in STRING_COLUMNS + INT_COLUMNS}
+
+        self._ids = np.load(self._path("ids.npy"), mmap_mode="r")
+        self._ids_sorted = np.load(self._path("ids.sorted.npy"), mmap_mode="r")
+        self._ids_order = np.load(self._path("ids.order.npy"), mmap_mode="r")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_column(self, column: str) -> np.ndarray:
+        path = self._path(f"meta.{column}.npy")
+        if not os.path.exists(path):
+            # Snapshot written before this column existed: every row is missing it
+            return np.full(len(np.load(self._path("ids.npy"), mmap_mode="r")), MISSING, dtype=np.int32)
+        return np.load(path, mmap_mode="r")
+
+    def _map_blob(self, name: str):
+        path = self._path(name)
+        if os.path.getsize(path) == 0:
+            return b""
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def doc_id(self, row: int) -> str:
+        return self._ids[row].decode("ascii")
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        key = doc_id.encode("ascii")
+        position = int(np.searchsorted(self._ids_sorted, key))
+        if position < len(self._ids_sorted) and self._ids_sorted[position] == key:
+            return int(self._ids_order[position])
+        return None
+
+    def text(self, row: int) -> str:
+        return self._text[int(self._text_offsets[row]):int(self._text_offsets[row + 1])].decode("utf-8")
+
+    def metadata(self, row: int) -> Dict:
+        metadata = {}
+        start, end = int(self._extra_offsets[row]), int(self._extra_offsets[row + 1])
+        if end > start:
+            metadata.update(json.loads(self._extra[start:end].decode("utf-8")))
+        for column in STRING_COLUMNS:
+            code = int(self._columns[column][row])
+            if code != MISSING:
+                metadata[column] = self._vocab[column][code]
+        for column in INT_COLUMNS:
+            value = int(self._columns[column][row])
+            if value != MISSING:
+                metadata[column] = value
+        return metadata
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column codes/values (memory-mapped), e.g. for partitioning or filtering."""
+        return self._columns[name]
+
+    def vocabulary(self, name: str) -> List[str]:
+        return self._vocab.get(name, [])
+
+    def document(self, row: int) -> Document:
+        return Document(id=self.doc_id(row), page_content=self.text(row), metadata=self.metadata(row))
+
+    def ids_with(self, column: str, value: str) -> List[str]:
+        """Docstore ids of the rows whose string column equals value (vectorized over the mmap)."""
+        vocabulary = self.vocabulary(column)
+        if value not in vocabulary:
+            return []
+        rows = np.flatnonzero(self._columns[column] == vocabulary.index(value))
+        return [self.doc_id(row) for row in rows]
+
+    @staticmethod
+    def write(directory: str, rows: Iterable[Tuple[str, str, Dict]]):
+        """Write a snapshot from (doc_id, text, metadata) rows, streaming the text blobs."""
+        os.makedirs(directory, exist_ok=True)
+        text_offsets, extra_offsets = [0], [0]
+        ids: List[bytes] = []
+        vocab: Dict[str, Dict[str, int]] = {column: {} for column in STRING_COLUMNS}
+        codes: Dict[str, List[int]] = {column: [] for column in STRING_COLUMNS + INT_COLUMNS}
+
+        with open(os.path.join(directory, "text.bin"), 'wb') as text_file, \
+                open(os.path.join(directory, "extra.bin"), 'wb') as extra_file:
+            for doc_id, text, metadata in rows:
+                ids.append(doc_id.encode("ascii"))
+
+                encoded = text.encode("utf-8")
+                text_file.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+
+                extra = {}
+                for key, value in metadata.items():
+                    if key in STRING_COLUMNS and isinstance(value, str):
+                        continue
+                    if key in INT_COLUMNS and isinstance(value, int) and value >= 0:
+                        continue
+                    extra[key] = value
+                encoded_extra = json.dumps(extra, default=str).encode("utf-8") if extra else b""
+                extra_file.write(encoded_extra)
+                extra_offsets.append(extra_offsets[-1] + len(encoded_extra))
+
+                for column in STRING_COLUMNS:
+                    value = metadata.get(column)
+                    if isinstance(value, str):
+                        codes[column].append(vocab[column].setdefault(value, len(vocab[column])))
+                    else:
+                        codes[column].append(MISSING)
+                for column in INT_COLUMNS:
+                    value = metadata.get(column)
+                    codes[column].append(value if isinstance(value, int) and value >= 0 else MISSING)
+
+            for handle in (text_file, extra_file):
+                handle.flush()
+                os.fsync(handle.fileno())
+
+        np.save(os.path.join(directory, "text.offsets.npy"), np.asarray(text_offsets, dtype=np.int64))
+        np.save(os.path.join(directory, "extra.offsets.npy"), np.asarray(extra_offsets, dtype=np.int64))
+        for column, values in codes.items():
+            np.save(os.path.join(directory, f"meta.{column}.npy"), np.asarray(values, dtype=np.int32))
+        with open(os.path.join(directory, "meta.dict.json"), 'w', encoding='utf-8') as f:
+            json.dump({column: list(values) for column, values in vocab.items()}, f)
+
+        id_array = np.asarray(ids, dtype=f"S{max((len(i) for i in ids), default=1)}")
+        order = np.argsort(id_array, kind="stable").astype(np.int64)
+        np.save(os.path.join(directory, "ids.npy"), id_array)
+        np.save(os.path.join(directory, "ids.sorted.npy"), id_array[order])
+        np.save(os.path.join(directory, "ids.order.npy"), order)
+
+
+class SnapshotIdMap(MutableMapping):
+    """
+    FAISS row -> docstore id. Rows in the snapshot are served from the mmap'd id
+    column; rows added since (write-log replay, new ingests) live in a small dict.
+    """
+
+    def __init__(self, store: Optional[ChunkStore]):
+        self.store = store
+        self._base_rows = len(store) if store is not None else 0
+        self._appended: Dict[int, str] = {}
+
+    def __getitem__(self, row) -> str:
+        row = int(row)
+        if 0 <= row < self._base_rows:
+            return self.store.doc_id(row)
+        return self._appended[row]
+
+    def __setitem__(self, row, doc_id: str):
+        row = int(row)
+        if row < self._base_rows:
+            raise KeyError(f"Row {row} belongs to the read-only snapshot")
+        self._appended[row] = doc_id
+
+    def __delitem__(self, row):
+        raise NotImplementedError("Snapshot rows are removed by compaction")
+
+    def __iter__(self) -> Iterator[int]:
+        yield from range(self._base_rows)
+        yield from self._appended
+
+    def __len__(self) -> int:
+        return self._base_rows + len(self._appended)
+
+    def copy(self) -> "SnapshotIdMap":
+        """Same snapshot, own overlay: rows added to the copy are invisible to this map."""
+        forked = SnapshotIdMap(self.store)
+        forked._appended = dict(self._appended)
+        return forked
+
+
+class SnapshotDocstore(Docstore, AddableMixin):
+    """Docstore over a ChunkStore snapshot plus an in-memory overlay for newer chunks."""
+
+    def __init__(self, store: Optional[ChunkStore]):
+        self.store = store
+        self._overlay: Dict[str, Document] = {}
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        for doc_id, document in texts.items():
+            # Search results carry their docstore id, so tombstoned chunks can be filtered out
+            document.id = document.id or doc_id
+            self._overlay[doc_id] = document
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("Snapshot rows are removed by compaction")
+
+    def copy(self) -> "SnapshotDocstore":
+        """Same snapshot, own overlay: chunks added to the copy are invisible to this docstore."""
+        forked = SnapshotDocstore(self.store)
+        forked._overlay = dict(self._overlay)
+        return forked
+
+    def ids_with(self, key: str, value: str) -> List[str]:
+        ids = [doc_id for doc_id, document in self._overlay.items() if document.metadata.get(key) == value]
+        if self.store is not None:
+            ids.extend(self.store.ids_with(key, value))
+        return ids
+
+    def search(self, search: str) -> Union[str, Document]:
+        document = self._overlay.get(search)
+        if document is not None:
+            return document
+        row = self.store.row_of(search) if self.store is not None else None
+        if row is None:
+            return f"ID {search} not found."
+        # Documents are only materialized for the rows a search actually returns
+        return self.store.document(row)
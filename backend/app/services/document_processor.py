@@ -1,9 +1,18 @@
 import os
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+def count_pdf_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract text for pages [start, end). Top-level so it can run in a worker process."""
+    reader = PdfReader(file_path)
+    return [(page_number, reader.pages[page_number].extract_text() or "") for page_number in range(start, min(end, len(reader.pages)))]
+
 class DocumentProcessor:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -36,6 +45,12 @@ class DocumentProcessor:
             print(f"Error processing file {file_path}: {e}")
             raise e
 
+    def chunk_page(self, text: str, page_number: int, metadata: Dict) -> List[Document]:
+        """Split and enrich a single page, same as process_file does per loaded page."""
+        page_doc = Document(page_content=text, metadata={**metadata, "page": page_number})
+        chunks = self.text_splitter.split_documents([page_doc])
+        return [self._enrich_chunk_context(chunk, metadata) for chunk in chunks]
+
     def _enrich_chunk_context(self, chunk: Document, metadata: Dict) -> Document:
         source = metadata.get("source", "Unknown Document")
         doc_type = metadata.get("type", "General")
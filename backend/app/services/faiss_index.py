@@ -0,0 +1,170 @@
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+import faiss
+import numpy as np
+from loguru import logger
+from app.core.config import settings
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# faiss warns below ~39 training points per centroid (IVF lists and 2^nbits PQ codebook entries)
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def is_lossy(index: faiss.Index) -> bool:
+    """True when reconstructed vectors are approximations (product-quantized codes)."""
+    return index_type_of(index) == "ivfpq"
+
+
+def default_nlist(num_vectors: int) -> int:
+    if settings.IVF_NLIST > 0:
+        return settings.IVF_NLIST
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def build_index(vectors: np.ndarray, index_type: str, nlist: Optional[int] = None) -> faiss.Index:
+    """
+    Build (and train, when required) an L2 index of the given type over vectors.
+
+    L2 keeps distances comparable with the flat index LangChain creates, so the
+    fast-track thresholds in VectorStoreService still apply. Falls back to a flat
+    index when the corpus is too small to train the requested structure.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Expected one of {INDEX_TYPES}")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+
+    if index_type in ("ivf", "ivfpq"):
+        nlist = nlist or default_nlist(num_vectors)
+        min_points = nlist * MIN_POINTS_PER_CENTROID
+        if index_type == "ivfpq":
+            min_points = max(min_points, MIN_POINTS_PER_CENTROID * 2 ** settings.PQ_NBITS)
+        if num_vectors < min_points:
+            logger.warning(f"Only {num_vectors} vectors, need {min_points} to train '{index_type}'. Using a flat index.")
+            index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, settings.HNSW_M)
+        index.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+    else:
+        if dim % settings.PQ_M != 0:
+            raise ValueError(f"PQ_M={settings.PQ_M} must divide the embedding dimension {dim}")
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, settings.PQ_M, settings.PQ_NBITS)
+
+    if not index.is_trained:
+        start = time.perf_counter()
+        index.train(vectors)
+        logger.info(f"Trained {index_type} index ({nlist} lists) on {num_vectors} vectors in {time.perf_counter() - start:.2f}s")
+
+    index.add(vectors)
+    configure_search(index)
+    return index
+
+
+def configure_search(index: faiss.Index, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+    """Apply query-time knobs (efSearch for HNSW, nprobe for IVF)."""
+    index_type = index_type_of(index)
+    if index_type == "hnsw":
+        index.hnsw.efSearch = ef_search or settings.HNSW_EF_SEARCH
+    elif index_type in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = nprobe or settings.IVF_NPROBE
+        # Row -> list position map, so partition searches can reconstruct individual rows
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Search parameters restricted to selector, keeping the configured efSearch / nprobe."""
+    index_type = index_type_of(index)
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if index_type in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """Return every stored vector in insertion order (approximate for PQ indexes)."""
+    if index_type_of(index) in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).make_direct_map()
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def describe_index(index: faiss.Index) -> Dict:
+    index_type = index_type_of(index)
+    info = {"type": index_type, "vectors": int(index.ntotal), "dim": int(index.d)}
+    if index_type == "hnsw":
+        info["efSearch"] = int(index.hnsw.efSearch)
+    elif index_type in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        info["nlist"] = int(ivf.nlist)
+        info["nprobe"] = int(ivf.nprobe)
+    return info
+
+
+def evaluate_index(index: faiss.Index, ground_truth: np.ndarray, queries: np.ndarray, k: int,
+                   ef_search_values: Sequence[int] = (16, 32, 64, 128, 256),
+                   nprobe_values: Sequence[int] = (1, 2, 4, 8, 16, 32, 64)) -> List[Dict]:
+    """
+    Recall@k (against exact flat results) and per-query latency for each
+    efSearch / nprobe setting the index type supports.
+    """
+    index_type = index_type_of(index)
+    if index_type == "hnsw":
+        sweep = [("efSearch", value) for value in ef_search_values]
+    elif index_type in ("ivf", "ivfpq"):
+        nlist = faiss.extract_index_ivf(index).nlist
+        sweep = [("nprobe", value) for value in nprobe_values if value <= nlist]
+    else:
+        sweep = [(None, None)]
+
+    report = []
+    for param, value in sweep:
+        if param == "efSearch":
+            configure_search(index, ef_search=value)
+        elif param == "nprobe":
+            configure_search(index, nprobe=value)
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, ground_truth):
+            start = time.perf_counter()
+            _, found = index.search(query.reshape(1, -1), k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found[0].tolist()) & set(expected.tolist()))
+
+        latencies_ms = np.array(latencies) * 1000
+        report.append({
+            "index_type": index_type,
+            "param": param,
+            "value": value,
+            f"recall@{k}": round(hits / (len(queries) * k), 4) if len(queries) else 0.0,
+            "mean_ms": round(float(latencies_ms.mean()), 4) if len(latencies) else 0.0,
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4) if len(latencies) else 0.0,
+        })
+
+    # Restore the configured defaults after the sweep
+    configure_search(index)
+    return report
@@ -0,0 +1,94 @@
+import base64
+import json
+import os
+from typing import Dict, Iterator, List, Sequence
+import numpy as np
+from loguru import logger
+
+
+class IndexWriteLog:
+    """
+    Append-only log of chunks added since the last compaction.
+
+    Each line holds one chunk (docstore id, text, metadata, float32 vector), so an
+    ingest only writes the new chunks instead of re-serializing the whole index.
+    Deletions and restores are logged as {"op": ..., "ids": [...]} lines.
+    The log is replayed on startup and truncated once compaction has folded it
+    into a new base index.
+
+    `offset` is how far this process has read or written the file. Other
+    processes serving the same index tail the log from their own offset.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = self.count_records()
+        self.offset = 0
+
+    def count_records(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            return sum(1 for _ in f)
+
+    @property
+    def size_bytes(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _write(self, lines: List[str]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+        self.records += len(lines)
+
+    def append(self, ids: Sequence[str], texts: Sequence[str], vectors: Sequence, metadatas: Sequence[Dict]):
+        lines = []
+        for doc_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+            encoded = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+            lines.append(json.dumps({"id": doc_id, "text": text, "metadata": metadata, "vector": encoded}, default=str) + "\n")
+        self._write(lines)
+
+    def append_op(self, op: str, ids: Sequence[str]):
+        self._write([json.dumps({"op": op, "ids": list(ids)}) + "\n"])
+
+    def replay(self, start: int = 0) -> Iterator[Dict]:
+        """Yield records from byte offset `start` on, advancing `offset` past each complete one."""
+        self.offset = start
+        if not os.path.exists(self.path):
+            return
+        valid_bytes = start
+        torn = False
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn write from a crash can only be the final line
+                    logger.warning(f"Dropping incomplete write-log record at byte {valid_bytes} of {self.path}")
+                    torn = True
+                    break
+                valid_bytes += len(line)
+                self.offset = valid_bytes
+                if "op" not in record:
+                    record["vector"] = np.frombuffer(base64.b64decode(record["vector"]), dtype=np.float32)
+                yield record
+
+        if torn:
+            # Cut the partial line so the next append starts on a clean line
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_bytes)
+            self.records = self.count_records()
+
+    def reset(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+        self.records = 0
+        self.offset = 0
@@ -0,0 +1,138 @@
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from app.services.chunk_store import MISSING, SnapshotDocstore
+
+# Metadata that partitions the index. Searches fan out per type (the first key).
+PARTITION_KEYS = ("type", "source", "category")
+# Golden KB entries (ingest_kb.py); their partition is small and searched first
+KB_TYPE = "kb_entry"
+
+PartitionKey = Tuple[Optional[str], ...]
+MetadataFilter = Mapping[str, Union[str, Iterable[str]]]
+
+_NO_ROWS = np.zeros(0, dtype=np.int64)
+
+
+def normalize_filter(metadata_filter: Optional[MetadataFilter]) -> Optional[Dict[str, Set[str]]]:
+    """{key: allowed values}; a single value may be given as a plain string. Raises ValueError on unknown keys."""
+    if not metadata_filter:
+        return None
+    normalized = {}
+    for key, values in metadata_filter.items():
+        if key not in PARTITION_KEYS:
+            raise ValueError(f"Cannot filter on '{key}'. Filterable metadata: {', '.join(PARTITION_KEYS)}")
+        normalized[key] = {values} if isinstance(values, str) else set(values)
+    return normalized
+
+
+def allows(metadata_filter: Optional[Dict[str, Set[str]]], key: str, value: Optional[str]) -> bool:
+    return metadata_filter is None or key not in metadata_filter or value in metadata_filter[key]
+
+
+class IndexPartitions:
+    """
+    FAISS row ids grouped by (type, source, category).
+
+    The vectors stay in the one FAISS index; a partition only records which rows
+    belong to it, so a filtered search can skip everything else. Rows in the
+    memory-mapped snapshot are grouped straight from its metadata columns, rows
+    added since from their metadata. Updates build a new mapping and swap it in,
+    so concurrent searches never see a half-updated one.
+    """
+
+    def __init__(self):
+        self._rows: Dict[PartitionKey, np.ndarray] = {}
+        self.total = 0
+
+    def update(self, vector_db: Optional[FAISS]):
+        """Assign the rows added to vector_db since the last update."""
+        if vector_db is None or vector_db.index.ntotal <= self.total:
+            return
+        start, ntotal = self.total, vector_db.index.ntotal
+        added: Dict[PartitionKey, List[np.ndarray]] = {}
+
+        docstore = vector_db.docstore
+        store = docstore.store if isinstance(docstore, SnapshotDocstore) else None
+        if store is not None and start < len(store):
+            end = min(len(store), ntotal)
+            codes = np.stack([np.asarray(store.column(key)[start:end]) for key in PARTITION_KEYS], axis=1)
+            groups, inverse = np.unique(codes, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.cumsum(np.bincount(inverse, minlength=len(groups)))[:-1]
+            for group_codes, rows in zip(groups, np.split(order, bounds)):
+                key = tuple(
+                    store.vocabulary(column)[code] if code != MISSING else None
+                    for column, code in zip(PARTITION_KEYS, group_codes.tolist())
+                )
+                added.setdefault(key, []).append(rows.astype(np.int64) + start)
+            start = end
+
+        id_map = vector_db.index_to_docstore_id
+        for row in range(start, ntotal):
+            doc = docstore.search(id_map[row])
+            metadata = doc.metadata if isinstance(doc, Document) else {}
+            key = tuple(metadata.get(column) if isinstance(metadata.get(column), str) else None for column in PARTITION_KEYS)
+            added.setdefault(key, []).append(np.asarray([row], dtype=np.int64))
+
+        partitions = dict(self._rows)
+        for key, arrays in added.items():
+            partitions[key] = np.concatenate([partitions.get(key, _NO_ROWS), *arrays])
+        self._rows = partitions
+        self.total = ntotal
+
+    def copy(self) -> "IndexPartitions":
+        forked = IndexPartitions()
+        forked._rows, forked.total = self._rows, self.total
+        return forked
+
+    def select(self, metadata_filter: Optional[Dict[str, Set[str]]]) -> Dict[Optional[str], np.ndarray]:
+        """Rows matching the filter, grouped by type (one search task per type)."""
+        grouped: Dict[Optional[str], List[np.ndarray]] = {}
+        for key, rows in self._rows.items():
+            if all(allows(metadata_filter, column, value) for column, value in zip(PARTITION_KEYS, key)):
+                grouped.setdefault(key[0], []).append(rows)
+        return {doc_type: np.concatenate(arrays) if len(arrays) > 1 else arrays[0] for doc_type, arrays in grouped.items()}
+
+    def stats(self) -> Dict[Optional[str], int]:
+        """Vectors per type."""
+        counts: Dict[Optional[str], int] = {}
+        for key, rows in self._rows.items():
+            counts[key[0]] = counts.get(key[0], 0) + len(rows)
+        return counts
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class PartitionedFAISS(FAISS):
+    """
+    LangChain FAISS store that keeps its IndexPartitions in step with every add.
+
+    An add is not safe while the same store is being searched (FAISS itself is
+    not, and LangChain grows the index before the id map). Stores that serve
+    queries are never added to: writers add to a fork() and swap it in.
+    """
+
+    def __init__(self, *args, partitions: Optional[IndexPartitions] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.partitions = partitions if partitions is not None else IndexPartitions()
+        self.partitions.update(self)
+
+    def fork(self) -> "PartitionedFAISS":
+        """
+        Copy that can be added to while this one keeps serving searches. The FAISS
+        index is cloned; the snapshot behind the docstore and id map is shared.
+        """
+        return PartitionedFAISS(
+            self.embedding_function, faiss.clone_index(self.index), self.docstore.copy(), self.index_to_docstore_id.copy(),
+            partitions=self.partitions.copy()
+        )
+
+    def add_embeddings(self, *args, **kwargs) -> List[str]:
+        ids = super().add_embeddings(*args, **kwargs)
+        self.partitions.update(self)
+        return ids
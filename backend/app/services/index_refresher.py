@@ -0,0 +1,58 @@
+import asyncio
+from typing import Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import registry
+from app.services.intent_index import intent_index
+from app.services.model_loader import ModelsNotReady, model_loader
+from app.services.vector_store import VectorStoreService
+
+refreshes = registry.counter("rag_index_refreshes_total", "Index changes picked up from other processes")
+
+
+class IndexRefresher:
+    """
+    Polls the shared index directory and applies what other processes committed
+    (other uvicorn workers, ingest_kb.py, rebuild_index.py): new write-log records
+    are tailed, a new base generation is loaded and swapped in whole. The Golden
+    KB intent index written by ingest_kb.py is reloaded when it changes.
+
+    Each worker keeps its own FAISS index; chunk text and metadata come from the
+    memory-mapped snapshot, whose pages the workers share through the page cache.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self):
+        try:
+            await model_loader.wait()
+        except ModelsNotReady:
+            return
+        vector_store = VectorStoreService()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Reloading a new generation reads the snapshot from disk; keep it off the loop
+                if await asyncio.to_thread(vector_store.refresh):
+                    refreshes.inc()
+                await asyncio.to_thread(intent_index.refresh)
+            except Exception as e:
+                logger.warning(f"Index refresh failed, retrying in {self.interval:.0f}s: {e}")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+index_refresher = IndexRefresher(settings.INDEX_REFRESH_INTERVAL_SECONDS)
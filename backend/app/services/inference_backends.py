@@ -0,0 +1,180 @@
+import json
+import os
+from typing import Any, List, Sequence, Tuple
+import numpy as np
+from langchain_community.embeddings import SentenceTransformerEmbeddings
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from app.core.config import settings
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+BACKENDS = ("torch", "onnx")
+
+# Layout written by export_onnx.py: ONNX_MODEL_DIR/{embedding,reranker}/<files below>
+EMBEDDING_DIR = "embedding"
+RERANKER_DIR = "reranker"
+MANIFEST_FILE = "manifest.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MANIFEST_FORMAT_VERSION = 1
+
+POOLING_MODES = ("mean", "cls", "max")
+# Texts per forward pass, as sentence-transformers batches them
+_BATCH_SIZE = 32
+
+
+def read_manifest(model_dir: str) -> dict:
+    with open(os.path.join(model_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        raise ValueError(f"{model_dir} was exported in an unsupported format; re-run export_onnx.py")
+    return manifest
+
+
+class _OnnxModel:
+    """
+    A transformer exported by export_onnx.py, run through ONNX Runtime.
+
+    Tokenization uses the model's own fast tokenizer (tokenizers, no torch), with
+    the truncation length recorded at export. Inputs are sorted by length before
+    batching, as sentence-transformers does, so padding stays short.
+    """
+
+    def __init__(self, model_dir: str, source_model: str, quantized: bool, intra_op_threads: int):
+        # Imported here: only the onnx backend needs onnxruntime, and it is an optional dependency
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.manifest = read_manifest(model_dir)
+        if self.manifest.get("source_model") != source_model:
+            raise ValueError(f"{model_dir} holds {self.manifest.get('source_model')}, expected {source_model}")
+
+        # A variant that failed the export-time comparison against PyTorch is never served:
+        # int8 falls back to the full-precision export, that one to PyTorch
+        variants = ([QUANTIZED_MODEL_FILE] if quantized and self.manifest.get("quantized") else []) + [MODEL_FILE]
+        parity = self.manifest.get("parity", {})
+        passed = [variant for variant in variants if parity.get(variant, {}).get("passed", True)]
+        if not passed:
+            raise ValueError(f"{model_dir}/{MODEL_FILE} failed its parity check against PyTorch")
+        self.model_file = passed[0]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        # Concurrency across requests comes from the inference executor threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, self.model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.manifest["max_length"])
+        self.tokenizer.enable_padding(pad_id=self.manifest["pad_token_id"], pad_token=self.manifest["pad_token"])
+
+    def _infer(self, inputs: Sequence, lengths: Sequence[int]) -> np.ndarray:
+        """Model outputs for each input, in input order."""
+        order = np.argsort(-np.asarray(lengths), kind="stable")
+        outputs = [None] * len(inputs)
+        for start in range(0, len(inputs), _BATCH_SIZE):
+            batch = order[start:start + _BATCH_SIZE]
+            encodings = self.tokenizer.encode_batch([inputs[i] for i in batch])
+            feed = {
+                "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            result = self._postprocess(self.session.run(None, {name: feed[name] for name in self.input_names})[0], feed["attention_mask"])
+            for position, row in zip(batch, result):
+                outputs[position] = row
+        return np.stack(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+
+    def _postprocess(self, output: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        return output
+
+
+class ONNXEmbeddings(_OnnxModel, Embeddings):
+    """Drop-in replacement for SentenceTransformerEmbeddings: transformer, pooling, optional normalization."""
+
+    def __init__(self, model_dir: str, quantized: bool, intra_op_threads: int):
+        super().__init__(model_dir, EMBEDDING_MODEL, quantized, intra_op_threads)
+        self.pooling = self.manifest["pooling"]
+        self.normalize = self.manifest["normalize"]
+
+    def _postprocess(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            if self.pooling == "max":
+                pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+            else:
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SentenceTransformerEmbeddings flattens newlines before encoding; match it
+        texts = [text.replace("\n", " ") for text in texts]
+        return self._infer(texts, [len(text) for text in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class ONNXCrossEncoder(_OnnxModel):
+    """Drop-in replacement for sentence-transformers' CrossEncoder.predict."""
+
+    def __init__(self, model_dir: str, quantized: bool, intra_op_threads: int):
+        super().__init__(model_dir, RERANKER_MODEL, quantized, intra_op_threads)
+        self.activation = self.manifest["activation"]
+
+    def predict(self, sentences: Sequence[Sequence[str]], **kwargs) -> np.ndarray:
+        pairs = [(query, text) for query, text in sentences]
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        scores = self._infer(pairs, [len(query) + len(text) for query, text in pairs])
+        if self.activation == "sigmoid":
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        # Single-label models score one float per pair
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+
+def load_torch_models() -> Tuple[Embeddings, Any]:
+    # Imported here: sentence-transformers pulls in torch, several seconds of import time
+    from sentence_transformers import CrossEncoder
+
+    embeddings = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL)
+    print("Loading Reranker Model...")
+    return embeddings, CrossEncoder(RERANKER_MODEL)
+
+
+def load_onnx_models(model_dir: str, quantized: bool, intra_op_threads: int) -> Tuple[Embeddings, Any]:
+    embeddings = ONNXEmbeddings(os.path.join(model_dir, EMBEDDING_DIR), quantized, intra_op_threads)
+    print("Loading Reranker Model...")
+    reranker = ONNXCrossEncoder(os.path.join(model_dir, RERANKER_DIR), quantized, intra_op_threads)
+    print(f"[ONNX] Serving {embeddings.model_file} (embeddings) and {reranker.model_file} (reranker) from {model_dir}")
+    return embeddings, reranker
+
+
+def load_models(backend: str = None) -> Tuple[Embeddings, Any, str]:
+    """
+    (embeddings, reranker, backend in use) for INFERENCE_BACKEND. The onnx backend
+    falls back to PyTorch when onnxruntime is not installed or the models have not
+    been exported (or failed their parity check).
+    """
+    backend = backend or settings.INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}'. Choose from: {', '.join(BACKENDS)}")
+
+    if backend == "onnx":
+        try:
+            return (*load_onnx_models(settings.ONNX_MODEL_DIR, settings.ONNX_QUANTIZED, settings.ONNX_INTRA_OP_THREADS), "onnx")
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable ({e}); falling back to PyTorch. Export the models with export_onnx.py")
+    return (*load_torch_models(), "torch")
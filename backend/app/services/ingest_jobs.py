@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.database import db
+from app.core.file_lock import InterProcessLock
+from app.models.schemas import IngestJob
+from app.services.ingestion_pipeline import IngestionProgress, ingestion_pipeline
+from app.services.model_loader import model_loader
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class MongoJobStore:
+    """Job records in the `ingest_jobs` collection."""
+
+    @property
+    def collection(self):
+        return db.db["ingest_jobs"]
+
+    async def save(self, job: IngestJob):
+        await self.collection.replace_one({"job_id": job.job_id}, job.model_dump(), upsert=True)
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        record = await self.collection.find_one({"job_id": job_id}, {"_id": 0})
+        return IngestJob(**record) if record else None
+
+    async def list(self, limit: int = 50) -> List[IngestJob]:
+        cursor = self.collection.find({}, {"_id": 0}).sort("created_at", -1).limit(limit)
+        return [IngestJob(**record) for record in await cursor.to_list(length=limit)]
+
+    async def list_active(self) -> List[IngestJob]:
+        cursor = self.collection.find({"status": {"$in": list(ACTIVE_STATUSES)}}, {"_id": 0}).sort("created_at", 1)
+        return [IngestJob(**record) for record in await cursor.to_list(length=None)]
+
+
+class LocalJobStore:
+    """JSON-file stand-in for MongoDB, for running without a database."""
+
+    MAX_JOBS = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._jobs: Optional[Dict[str, Dict]] = None
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._jobs is None:
+            self._jobs = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._jobs = json.load(f)
+        return self._jobs
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self._jobs, f, indent=2)
+        os.replace(self.path + ".tmp", self.path)
+
+    def _sorted(self) -> List[IngestJob]:
+        return sorted((IngestJob(**record) for record in self._load().values()), key=lambda job: job.created_at)
+
+    async def save(self, job: IngestJob):
+        jobs = self._load()
+        jobs[job.job_id] = job.model_dump(mode="json")
+        if len(jobs) > self.MAX_JOBS:
+            finished = [job for job in self._sorted() if job.status not in ACTIVE_STATUSES]
+            for old_job in finished[:len(jobs) - self.MAX_JOBS]:
+                jobs.pop(old_job.job_id, None)
+        self._flush()
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        record = self._load().get(job_id)
+        return IngestJob(**record) if record else None
+
+    async def list(self, limit: int = 50) -> List[IngestJob]:
+        return list(reversed(self._sorted()))[:limit]
+
+    async def list_active(self) -> List[IngestJob]:
+        return [job for job in self._sorted() if job.status in ACTIVE_STATUSES]
+
+
+class IngestJobManager:
+    """
+    Runs uploads through the ingestion pipeline as tracked jobs.
+
+    At most INGEST_MAX_CONCURRENT_JOBS run at once; the rest wait as "queued".
+    Progress is persisted every INGEST_PROGRESS_INTERVAL_SECONDS, and jobs left
+    queued or running by a previous process are resumed on startup; re-running a
+    file only embeds chunks that are not already stored. With several workers
+    only the one holding the resume lock does that, so a job is not resumed twice.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._resume_lock = InterProcessLock(settings.INGEST_RESUME_LOCK_PATH)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._live: Dict[str, IngestJob] = {}
+
+    def _slots(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.INGEST_MAX_CONCURRENT_JOBS)
+        return self._semaphore
+
+    async def submit(self, filename: str, file_path: str) -> IngestJob:
+        job = IngestJob(
+            job_id=str(uuid.uuid4()),
+            filename=filename,
+            file_path=file_path,
+            created_at=datetime.utcnow()
+        )
+        await self.store.save(job)
+        self._schedule(job)
+        return job
+
+    def _schedule(self, job: IngestJob):
+        self._live[job.job_id] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.job_id, None))
+
+    @staticmethod
+    def _apply_progress(job: IngestJob, progress: IngestionProgress):
+        for field, value in progress.to_dict().items():
+            setattr(job, field, value)
+
+    async def _report_progress(self, job: IngestJob, progress: IngestionProgress):
+        while True:
+            await asyncio.sleep(settings.INGEST_PROGRESS_INTERVAL_SECONDS)
+            self._apply_progress(job, progress)
+            try:
+                await self.store.save(job)
+            except Exception as e:
+                logger.warning(f"Failed to persist progress for ingest job {job.job_id}: {e}")
+
+    async def _run(self, job: IngestJob):
+        async with self._slots():
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            job.attempts += 1
+            await self.store.save(job)
+
+            progress = IngestionProgress()
+            reporter = asyncio.create_task(self._report_progress(job, progress))
+            try:
+                # Chunks are embedded with the service's model; wait for the startup load
+                await model_loader.wait()
+                metadata = {"source": job.filename, "type": "pdf"}
+                await ingestion_pipeline.run(job.file_path, metadata, progress)
+                job.status = "completed"
+            except Exception as e:
+                logger.error(f"Ingest job {job.job_id} ({job.filename}) failed: {e}")
+                job.status = "failed"
+                job.errors.append(f"{type(e).__name__}: {e}")
+            finally:
+                reporter.cancel()
+                self._apply_progress(job, progress)
+                if job.status != "running":  # cancelled at shutdown: stays resumable
+                    job.finished_at = datetime.utcnow()
+                await self.store.save(job)
+                self._live.pop(job.job_id, None)
+
+            logger.info(
+                f"Ingest job {job.job_id} {job.status}: {job.chunks_committed} chunks added, "
+                f"{job.chunks_skipped} unchanged, {job.chunks_removed} removed from "
+                f"{job.pages_parsed}/{job.total_pages} pages in {job.elapsed_seconds:.1f}s"
+            )
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        # Running jobs are served from memory so progress is always current
+        return self._live.get(job_id) or await self.store.get(job_id)
+
+    async def list(self, limit: int = 50) -> List[IngestJob]:
+        jobs = await self.store.list(limit)
+        return [self._live.get(job.job_id, job) for job in jobs]
+
+    async def resume_pending(self):
+        """Re-queue jobs a previous process left unfinished (e.g. after a restart)."""
+        # Held until this worker exits; a worker started later only takes over once it is gone
+        if not self._resume_lock.acquire(blocking=False):
+            logger.info("Another worker holds the ingest resume lock, not resuming jobs here")
+            return
+        try:
+            pending = await self.store.list_active()
+        except Exception as e:
+            logger.warning(f"Could not load pending ingest jobs: {e}")
+            return
+
+        for job in pending:
+            if job.job_id in self._tasks:
+                continue
+            if not os.path.exists(job.file_path):
+                job.status = "failed"
+                job.errors.append("Uploaded file missing after restart")
+                job.finished_at = datetime.utcnow()
+                await self.store.save(job)
+                continue
+            logger.info(f"Resuming ingest job {job.job_id} ({job.filename}), previous status: {job.status}")
+            if job.status == "running":
+                job.errors.append("Restarted after worker shutdown")
+            job.status = "queued"
+            job.finished_at = None
+            await self.store.save(job)
+            self._schedule(job)
+
+    async def shutdown(self):
+        # Cancelled jobs keep their "running" status and are picked up on next start
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._resume_lock.held:
+            self._resume_lock.release()
+
+
+def _create_store():
+    if settings.INGEST_JOB_STORE == "local":
+        return LocalJobStore(settings.INGEST_JOB_STORE_PATH)
+    return MongoJobStore()
+
+
+ingest_job_manager = IngestJobManager(_create_store())
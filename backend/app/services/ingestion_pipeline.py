@@ -0,0 +1,213 @@
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Deque, Dict, Optional
+from loguru import logger
+from app.core.config import settings
+from app.services.document_processor import DocumentProcessor, count_pdf_pages, extract_page_range
+from app.services.vector_store import VectorStoreService
+
+_DONE = object()
+
+
+def _lower_priority():
+    """Process-pool initializer: PDF parsing should yield the CPU to request serving."""
+    if hasattr(os, "nice"):
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+class IngestionProgress:
+    """Live counters for one pipeline run; safe to read while the run is in flight."""
+
+    def __init__(self):
+        self.total_pages = 0
+        self.pages_parsed = 0
+        self.chunks_created = 0
+        self.chunks_embedded = 0
+        self.chunks_committed = 0
+        self.chunks_skipped = 0
+        self.chunks_removed = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def pages_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.pages_parsed / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_pages": self.total_pages,
+            "pages_parsed": self.pages_parsed,
+            "chunks_created": self.chunks_created,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_committed": self.chunks_committed,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_removed": self.chunks_removed,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "pages_per_second": round(self.pages_per_second, 2),
+        }
+
+
+class IngestionPipeline:
+    """
+    Streaming PDF ingestion in four stages connected by bounded queues:
+
+    1. page extraction in a process pool (a few pages per task, in page order)
+    2. chunking + context enrichment, page by page
+    3. batched embedding on a dedicated thread (INGEST_EMBED_BATCH_SIZE chunks per call)
+    4. a single writer that commits embedded batches to the vector store
+
+    Bounded queues give backpressure, so memory stays flat regardless of PDF size,
+    and none of the heavy work runs on the event loop. Commits never touch the
+    index that is serving queries: the vector store adds to a copy and swaps it in.
+
+    Re-ingesting a source is incremental: chunks whose content id is already stored
+    are skipped before embedding, and stored chunks the new file no longer produces
+    are deleted once the run completes.
+    """
+
+    def __init__(self, processor: DocumentProcessor, vector_store: Optional[VectorStoreService] = None):
+        self.processor = processor
+        self._vector_store = vector_store
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._embed_executor: Optional[ThreadPoolExecutor] = None
+        self._writer_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def vector_store(self) -> VectorStoreService:
+        return self._vector_store or VectorStoreService()
+
+    @property
+    def process_workers(self) -> int:
+        return settings.INGEST_PROCESS_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+
+    def _ensure_pools(self):
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers, initializer=_lower_priority)
+            self._embed_executor = ThreadPoolExecutor(max_workers=settings.INGEST_EMBED_THREADS, thread_name_prefix="ingest-embed")
+            self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+
+    async def run(self, file_path: str, metadata: Dict, progress: Optional[IngestionProgress] = None) -> IngestionProgress:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        self._ensure_pools()
+        progress = progress or IngestionProgress()
+        loop = asyncio.get_running_loop()
+        vector_store = self.vector_store
+
+        progress.total_pages = await loop.run_in_executor(self._process_pool, count_pdf_pages, file_path)
+        existing = await loop.run_in_executor(self._writer_executor, vector_store.source_chunk_ids, metadata.get("source"))
+        seen = set()
+
+        page_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        commit_queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.INGEST_QUEUE_SIZE // settings.INGEST_EMBED_BATCH_SIZE))
+
+        async def extract_pages():
+            step = settings.INGEST_PAGES_PER_TASK
+            in_flight: Deque[asyncio.Future] = deque()
+
+            async def forward_oldest():
+                for page in await in_flight.popleft():
+                    await page_queue.put(page)
+                    progress.pages_parsed += 1
+
+            for start in range(0, progress.total_pages, step):
+                in_flight.append(loop.run_in_executor(self._process_pool, extract_page_range, file_path, start, start + step))
+                if len(in_flight) >= self.process_workers * 2:
+                    await forward_oldest()
+            while in_flight:
+                await forward_oldest()
+            await page_queue.put(_DONE)
+
+        async def chunk_pages():
+            occurrences = Counter()
+            while (item := await page_queue.get()) is not _DONE:
+                page_number, text = item
+                chunks = vector_store.assign_chunk_ids(self.processor.chunk_page(text, page_number, metadata), occurrences)
+                for chunk in chunks:
+                    await chunk_queue.put(chunk)
+                    progress.chunks_created += 1
+            await chunk_queue.put(_DONE)
+
+        async def embed_chunks():
+            batch = []
+            while True:
+                item = await chunk_queue.get()
+                if item is not _DONE:
+                    seen.add(item.metadata["chunk_id"])
+                    if item.metadata["chunk_id"] in existing:
+                        progress.chunks_skipped += 1
+                    else:
+                        batch.append(item)
+                if batch and (item is _DONE or len(batch) >= settings.INGEST_EMBED_BATCH_SIZE):
+                    vectors = await loop.run_in_executor(
+                        self._embed_executor, vector_store.embed_documents, [chunk.page_content for chunk in batch]
+                    )
+                    progress.chunks_embedded += len(batch)
+                    await commit_queue.put((batch, vectors))
+                    batch = []
+                if item is _DONE:
+                    break
+            await commit_queue.put(_DONE)
+
+        async def commit_batches():
+            done = False
+            while not done:
+                item = await commit_queue.get()
+                if item is _DONE:
+                    break
+                chunks, vectors = list(item[0]), list(item[1])
+                # Batches embedded while the last commit ran go in together: every commit
+                # forks the serving index and swaps it in, so fewer commits copy it less often
+                while not commit_queue.empty():
+                    item = commit_queue.get_nowait()
+                    if item is _DONE:
+                        done = True
+                        break
+                    chunks += item[0]
+                    vectors += item[1]
+                await loop.run_in_executor(self._writer_executor, vector_store.add_embedded_documents, chunks, vectors)
+                progress.chunks_committed += len(chunks)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(extract_pages())
+                group.create_task(chunk_pages())
+                group.create_task(embed_chunks())
+                group.create_task(commit_batches())
+            # Only prune after a complete run, so a failed ingest never loses stored chunks
+            progress.chunks_removed = await loop.run_in_executor(
+                self._writer_executor, vector_store.delete_documents, existing - seen
+            )
+        except ExceptionGroup as group_error:
+            raise group_error.exceptions[0]
+        finally:
+            progress.finished_at = time.time()
+
+        logger.info(
+            f"Ingested {file_path}: {progress.pages_parsed} pages, {progress.chunks_committed} chunks added, "
+            f"{progress.chunks_skipped} unchanged, {progress.chunks_removed} removed "
+            f"in {progress.elapsed_seconds:.2f}s ({progress.pages_per_second:.1f} pages/s)"
+        )
+        return progress
+
+    def shutdown(self):
+        for pool in (self._process_pool, self._embed_executor, self._writer_executor):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool = self._embed_executor = self._writer_executor = None
+
+
+ingestion_pipeline = IngestionPipeline(processor=DocumentProcessor())
@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import registry
+
+intent_lookups = registry.counter(
+    "rag_kb_intent_lookups_total", "Golden KB intent index lookups by match kind (exact, token_set, fuzzy, miss)", labelnames=("match",)
+)
+
+INDEX_FORMAT_VERSION = 1
+
+# Words that do not change what is being asked; question words ("how", "why") are kept
+_STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "for", "to", "and",
+    "do", "does", "did", "can", "could", "please", "me", "tell", "i", "we", "you", "about",
+})
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# A fuzzy match must beat the best match for any other entry by this much
+_FUZZY_MARGIN = 0.1
+# KB entries that instruct the agent (e.g. the output schema) rather than answer a question
+NON_ANSWER_CATEGORIES = frozenset({"output_format"})
+
+
+def normalize_intent(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def _content_tokens(normalized: str) -> FrozenSet[str]:
+    return frozenset(word for word in normalized.split() if word not in _STOPWORDS)
+
+
+def _trigrams(tokens: FrozenSet[str]) -> FrozenSet[str]:
+    # Over the sorted content words, so word order and filler words do not matter
+    padded = f"  {' '.join(sorted(tokens))} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def build_intent_index(kb_data: Dict, followups) -> Dict:
+    """
+    Serializable intent index for the Golden KB: every question intent mapped to
+    its entry, with the answer, title and follow-ups extracted up front.
+    Built by ingest_kb.py next to the vector index.
+    """
+    entries, intents = {}, []
+    source = kb_data.get("source_document", {}).get("title")
+    for entry in kb_data.get("entries", []):
+        entry_id = entry.get("id")
+        if not entry_id or not entry.get("content") or entry.get("category") in NON_ANSWER_CATEGORIES:
+            continue
+        entries[entry_id] = {
+            "title": entry.get("title", "Knowledge Base Entry"),
+            "source": source,
+            "category": entry.get("category"),
+            "answer": entry["content"].strip(),
+            "follow_up_questions": followups.get_followup_questions(entry_id, max_questions=3),
+        }
+        for intent in entry.get("question_intents", []):
+            normalized = normalize_intent(intent)
+            if normalized:
+                intents.append({"intent": normalized, "entry_id": entry_id})
+    return {
+        "format_version": INDEX_FORMAT_VERSION,
+        "kb_version": kb_data.get("version"),
+        "built_at": time.time(),
+        "entries": entries,
+        "intents": intents,
+    }
+
+
+def save_intent_index(index: Dict, path: str):
+    # Write then rename, so serving processes never load a half-written file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Tables:
+    """Lookup tables derived from one intent index file."""
+
+    def __init__(self, data: Dict):
+        self.entries: Dict[str, Dict] = data.get("entries", {})
+        self.exact: Dict[str, Optional[str]] = {}
+        self.token_sets: Dict[FrozenSet[str], Optional[str]] = {}
+        self.trigrams: List[Tuple[FrozenSet[str], int, str]] = []
+        self.postings: Dict[str, List[int]] = {}
+
+        for item in data.get("intents", []):
+            entry_id = item["entry_id"]
+            # Index files built before non-answer entries were left out may still list them
+            if entry_id not in self.entries or self.entries[entry_id].get("category") in NON_ANSWER_CATEGORIES:
+                continue
+            tokens = _content_tokens(item["intent"])
+            # An intent shared by two entries is ambiguous: None marks it as no answer
+            _claim(self.exact, item["intent"], entry_id)
+            if tokens:
+                _claim(self.token_sets, tokens, entry_id)
+                grams = _trigrams(tokens)
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(len(self.trigrams))
+                self.trigrams.append((grams, len(tokens), entry_id))
+
+
+def _claim(table: Dict, key, entry_id: str):
+    if key in table and table[key] != entry_id:
+        table[key] = None
+    else:
+        table[key] = entry_id
+
+
+class IntentIndex:
+    """
+    In-memory Golden KB lookup that answers a question without embedding it.
+
+    A query is matched, in order, on its normalized text, on its set of content
+    words (ignoring order and filler words), then on character trigram overlap
+    (Jaccard) for misspellings. Only a confident, unambiguous
+    match returns an entry; everything else goes on to dense retrieval.
+    """
+
+    def __init__(self, path: str, fuzzy_threshold: float):
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._tables: Optional[_Tables] = None
+        self._mtime = None
+        self.refresh()
+
+    @property
+    def loaded(self) -> bool:
+        return self._tables is not None
+
+    def refresh(self) -> bool:
+        """Reload the index file if ingest_kb.py rewrote it. True when something changed."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+
+        if mtime is None:
+            self._tables = None
+            print(f"[IntentIndex] {self.path} not found; run ingest_kb.py to enable the KB intent fast path")
+        else:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[IntentIndex] Error loading {self.path}: {e}")
+                return False
+            if data.get("format_version") != INDEX_FORMAT_VERSION:
+                print(f"[IntentIndex] {self.path} has an unsupported format; re-run ingest_kb.py")
+                self._tables = None
+            else:
+                self.load(data)
+                print(f"[IntentIndex] Loaded {len(self._tables.exact)} intents for {len(self._tables.entries)} KB entries")
+        self._mtime = mtime
+        return True
+
+    def load(self, data: Dict):
+        """Serve an index built by build_intent_index."""
+        # Swapped in whole, so concurrent lookups see either the old or the new tables
+        self._tables = _Tables(data)
+
+    def entry(self, entry_id: str) -> Optional[Dict]:
+        tables = self._tables
+        return tables.entries.get(entry_id) if tables is not None else None
+
+    def match(self, query: str) -> Optional[Tuple[str, Dict, str]]:
+        """(entry_id, entry, match kind) for a confident match, else None."""
+        tables = self._tables
+        if tables is None:
+            return None
+
+        normalized = normalize_intent(query)
+        tokens = _content_tokens(normalized)
+        for kind, table, key in (("exact", tables.exact, normalized), ("token_set", tables.token_sets, tokens)):
+            if key in table:
+                entry_id = table[key]
+                if entry_id is None:
+                    break  # ambiguous across entries
+                intent_lookups.inc(match=kind)
+                return entry_id, tables.entries[entry_id], kind
+
+        entry_id = self._fuzzy_match(tables, tokens) if tokens else None
+        if entry_id is None:
+            intent_lookups.inc(match="miss")
+            return None
+        intent_lookups.inc(match="fuzzy")
+        return entry_id, tables.entries[entry_id], "fuzzy"
+
+    def _fuzzy_match(self, tables: _Tables, tokens: FrozenSet[str]) -> Optional[str]:
+        grams = _trigrams(tokens)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for position in tables.postings.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        # Best Jaccard score per entry. Only intents with as many content words as the
+        # query compete: fuzzy matching absorbs misspellings, an extra word is a different question
+        best: Dict[str, float] = {}
+        for position, overlap in shared.items():
+            intent_grams, word_count, entry_id = tables.trigrams[position]
+            if word_count != len(tokens):
+                continue
+            score = overlap / (len(grams) + len(intent_grams) - overlap)
+            if score > best.get(entry_id, 0.0):
+                best[entry_id] = score
+        if not best:
+            return None
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        top_id, top_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if top_score >= self.fuzzy_threshold and top_score - runner_up >= _FUZZY_MARGIN:
+            return top_id
+        return None
+
+
+intent_index = IntentIndex(settings.KB_INTENT_INDEX_PATH, settings.KB_INTENT_FUZZY_THRESHOLD)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.inference import inference_executor
+from app.core.metrics import registry, timed_stage
+from app.core.token_manager import token_manager
+from app.services.vector_store import VectorStoreService
+
+
+class ModelsNotReady(Exception):
+    """Raised when a request needs the models before the startup load has finished."""
+
+
+class ModelLoader:
+    """
+    Loads the embedding model, the CrossEncoder and the FAISS index in the
+    background during lifespan startup, so uvicorn opens its port right away.
+    Liveness (/health) answers immediately; readiness (/health/ready), the query
+    endpoints and ingest jobs wait for the load to finish.
+
+    status: pending -> loading -> ready | failed
+    """
+
+    def __init__(self):
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.time_to_ready: Optional[float] = None
+        self._done: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._done = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._load())
+
+    async def _load(self):
+        started = time.perf_counter()
+        self.status = "loading"
+        try:
+            # Model loading is blocking; keep it off the event loop (and off the bounded inference executor)
+            with timed_stage(self.timings, "load_models"):
+                await asyncio.to_thread(VectorStoreService)
+            with timed_stage(self.timings, "load_tokenizer"):
+                await asyncio.to_thread(token_manager.count_tokens, "warmup")
+            if settings.WARMUP_ENABLED and settings.WARMUP_QUERIES:
+                with timed_stage(self.timings, "warmup"):
+                    await self._warmup()
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.exception(f"Model loading failed after {time.perf_counter() - started:.2f}s")
+            return
+        finally:
+            self._done.set()
+
+        self.time_to_ready = time.perf_counter() - started
+        self.status = "ready"
+        logger.info(
+            f"Ready in {self.time_to_ready:.2f}s (" +
+            ", ".join(f"{stage}={secs:.2f}s" for stage, secs in self.timings.items()) + ")"
+        )
+
+    async def _warmup(self):
+        """
+        Run a few queries end to end through embedding, FAISS and reranking, so the
+        first real request does not pay for lazy allocations and first-call overhead.
+        """
+        vector_store = VectorStoreService()
+        for query in settings.WARMUP_QUERIES:
+            docs = await vector_store.asearch(query, k=5)
+            if docs:
+                # The search may fast-track past the reranker; exercise it explicitly
+                await inference_executor.run(vector_store._rerank, query, docs)
+
+    async def wait(self):
+        """Wait for the startup load. Raises ModelsNotReady if it failed or was never started."""
+        if self._done is None:
+            raise ModelsNotReady("Model loading has not been started")
+        await self._done.wait()
+        if not self.ready:
+            raise ModelsNotReady(f"Model loading failed: {self.error}")
+
+    def stats(self) -> Dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "time_to_ready_seconds": round(self.time_to_ready, 3) if self.time_to_ready is not None else None,
+            "timings_seconds": {stage: round(secs, 3) for stage, secs in self.timings.items()},
+        }
+
+    async def stop(self):
+        # A load still running in its thread cannot be interrupted; the process exit ends it
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+model_loader = ModelLoader()
+
+registry.callback(
+    "rag_models_ready", "1 once models and index are loaded and warmed up", "gauge",
+    lambda: [({}, 1 if model_loader.ready else 0)]
+)
+registry.callback(
+    "rag_time_to_ready_seconds", "Seconds from lifespan startup until the service was ready", "gauge",
+    lambda: [({}, model_loader.time_to_ready)] if model_loader.time_to_ready is not None else []
+)
@@ -0,0 +1,192 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from app.models.schemas import ComplianceAssessment
+
+_FENCED_JSON = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+# What may follow the quote that closes a string; any other quote is part of the text
+_STRING_END = re.compile(r'\s*(?:[,:}\]]|$)')
+_PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+
+_STRING_FIELDS = ("response", "status", "reasoning", "conversation_type")
+_LIST_FIELDS = ("relevant_clauses", "follow_up_questions")
+
+
+def extract_json_from_markdown(text: str) -> str:
+    """Extract JSON from markdown code blocks if present"""
+    match = _FENCED_JSON.search(text)
+    return match.group(1) if match else text
+
+
+def _closes_string(text: str, i: int) -> bool:
+    """Whether the quote at text[i] ends its string: only a separator (or the end) may follow it."""
+    return _STRING_END.match(text, i + 1) is not None
+
+
+def _outer_object(text: str) -> str:
+    """
+    Drop prose before the first '{' and after the '}' that closes it (braces inside
+    strings do not count), or keep the tail if it is never closed (truncated).
+    """
+    start = text.find("{")
+    if start < 0:
+        return text
+    depth = 0
+    quote: Optional[str] = None
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote and _closes_string(text, i):
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _repair_syntax(text: str) -> Tuple[str, bool]:
+    """
+    Single pass over the text that fixes what LLMs typically get wrong: raw
+    newlines inside strings, unescaped quotes inside strings, Python literals,
+    single-quoted strings, and output cut off mid-string or mid-object (closed
+    in order). Returns (repaired text, whether it had to close truncated output).
+    """
+    out: List[str] = []
+    closers: List[str] = []
+    quote: Optional[str] = None
+    escaped = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+                # \' is valid in a single-quoted string but not in JSON
+                out.append(char if char == "'" else "\\" + char)
+            elif char == "\\":
+                escaped = True
+            elif char == quote and _closes_string(text, i):
+                quote = None
+                out.append('"')
+            elif char == '"':
+                out.append('\\"')  # a double quote inside a single-quoted string
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\t":
+                out.append("\\t")
+            else:
+                out.append(char)
+        elif char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            if closers:
+                closers.pop()
+            out.append(char)
+        else:
+            word = re.match(r"None|True|False", text[i:])
+            if word and not (out and (out[-1].isalnum() or out[-1] == "_")):
+                out.append(_PYTHON_LITERALS[word.group(0)])
+                i += len(word.group(0))
+                continue
+            out.append(char)
+        i += 1
+
+    truncated = bool(quote or closers)
+    if quote:
+        out.append('"')
+    repaired = "".join(out).rstrip()
+    # A dangling key or separator left by truncation cannot be completed
+    if closers and closers[-1] == "}":
+        repaired = re.sub(r'([{,])\s*"[^"]*"\s*:?\s*$', r"\1", repaired)
+    repaired = re.sub(r'[,:]\s*$', "", repaired)
+    repaired += "".join(reversed(closers))
+    return _TRAILING_COMMA.sub(r"\1", repaired), truncated
+
+
+def _recover_fields(text: str) -> Dict[str, Any]:
+    """
+    Last local resort: pull individual known fields out of otherwise unparseable
+    output. A string counts only when its closing quote is followed by ',' or '}':
+    an unescaped quote inside the value would otherwise cut it short silently.
+    """
+    recovered: Dict[str, Any] = {}
+    for field in _STRING_FIELDS:
+        match = re.search(rf'"{field}"\s*:\s*"((?:[^"\\]|\\.)*)"\s*[,}}]', text, re.DOTALL)
+        if match:
+            try:
+                recovered[field] = json.loads(f'"{match.group(1)}"')
+            except ValueError:
+                recovered[field] = match.group(1)
+    for field in _LIST_FIELDS:
+        match = re.search(rf'"{field}"\s*:\s*\[(.*?)\]', text, re.DOTALL)
+        if match:
+            recovered[field] = re.findall(r'"((?:[^"\\]|\\.)*)"', match.group(1))
+    return recovered
+
+
+def _validate(data: Any) -> Tuple[ComplianceAssessment, bool]:
+    """
+    Validate, dropping fields with the wrong shape instead of rejecting the whole
+    answer. Returns (assessment, whether any field was dropped).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("LLM output is not a JSON object")
+    data = dict(data)
+    dropped = False
+    for _ in range(len(data) + 1):
+        try:
+            return ComplianceAssessment(**data), dropped
+        except ValidationError as e:
+            invalid = {error["loc"][0] for error in e.errors() if error.get("loc")}
+            if not invalid & data.keys():
+                raise
+            for field in invalid:
+                data.pop(field, None)
+            dropped = True
+    return ComplianceAssessment(**data), dropped
+
+
+def parse_assessment(content: str) -> Tuple[ComplianceAssessment, str]:
+    """
+    Parse raw LLM output into a ComplianceAssessment without another LLM call.
+
+    Returns (assessment, outcome) where outcome is "clean", "repaired" (syntax
+    fixed, nothing lost) or "partial" (output was cut off, or fields had to be
+    dropped or recovered one by one; not worth caching). Raises ValueError when
+    not even the 'response' field can be recovered intact.
+    """
+    text = extract_json_from_markdown(content).strip()
+
+    try:
+        assessment, dropped = _validate(json.loads(text))
+        return assessment, "partial" if dropped else "clean"
+    except (ValueError, ValidationError):
+        pass
+
+    repaired, truncated = _repair_syntax(_outer_object(text))
+    try:
+        assessment, dropped = _validate(json.loads(repaired))
+        return assessment, "partial" if truncated or dropped else "repaired"
+    except (ValueError, ValidationError):
+        pass
+
+    recovered = _recover_fields(text)
+    if recovered.get("response"):
+        return _validate(recovered)[0], "partial"
+    raise ValueError("Could not recover a response from the LLM output")
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_QUERY_LINE = re.compile(r"Current Query:\s*(.+)")
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for the Groq chat model, for benchmarks and
+    load tests. Answers every prompt with a valid ComplianceAssessment JSON built
+    from the query, after an optional simulated latency.
+    """
+
+    latency_ms: float = 0.0
+    chunk_size: int = 16
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content if messages else ""
+        match = _QUERY_LINE.search(prompt)
+        query = match.group(1).strip() if match else ""
+        return json.dumps({
+            "response": f"Based on the regulatory context, here is the guidance for: {query}",
+            "status": "Needs Review",
+            "reasoning": f"Stub analysis over {len(prompt)} prompt characters.",
+            "relevant_clauses": [],
+            "sources": [],
+            "conversation_type": "analysis",
+            "follow_up_questions": []
+        })
+
+    def _chunks(self, content: str) -> List[str]:
+        return [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000.0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # The simulated latency is spent before the first token
+        time.sleep(self.latency_ms / 1000.0)
+        for piece in self._chunks(self._respond(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        for piece in self._chunks(self._respond(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
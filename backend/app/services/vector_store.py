@@ -1,13 +1,189 @@
+import asyncio
+import hashlib
+import heapq
 import os
-import pickle
-from typing import List, Tuple
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_core.documents import Document
-from sentence_transformers import CrossEncoder
+from loguru import logger
+from app.core.background import background_runner
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.file_lock import InterProcessLock
+from app.core.inference import inference_executor
+from app.core.metrics import registry, timed_stage
+from app.core.token_manager import token_manager
+from app.services.adaptive_rerank import RerankCascade
+from app.services.chunk_store import ChunkStore, SnapshotDocstore, SnapshotIdMap
+from app.services.faiss_index import (
+    build_index, configure_search, describe_index, index_type_of, is_lossy, reconstruct_all, search_parameters
+)
+from app.services.index_log import IndexWriteLog
+from app.services.index_partitions import KB_TYPE, MetadataFilter, PartitionedFAISS, allows, normalize_filter
+from app.services.inference_backends import load_models
+
+
+fast_track_hits = registry.counter("rag_fast_track_total", "Searches answered from a confident Golden KB match without reranking")
+
+
+class _BatchRequest:
+    __slots__ = ("items", "future", "enqueued_at")
+
+    def __init__(self, items: Sequence, future: asyncio.Future):
+        self.items = items
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """
+    Micro-batches model calls across concurrent requests.
+
+    Items from in-flight queries are gathered for up to max_wait_ms (or until
+    max_batch items are queued), run through a single batched call on the
+    inference executor, and the outputs are scattered back to each caller.
+    Used for CrossEncoder reranking and for query embedding.
+    """
+
+    BATCH_SIZE_BUCKETS = (1, 4, 16, 32, 64, 128, 256)
+
+    def __init__(self, batch_fn: Callable, max_wait_ms: float, max_batch: int, stage: str):
+        self._batch_fn = batch_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self.stage = stage
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop = None
+
+        self.batches = 0
+        self.requests = 0
+        self.items_processed = 0
+        self.max_batch_seen = 0
+        self.batch_size_histogram = {bucket: 0 for bucket in self.BATCH_SIZE_BUCKETS}
+        self.batch_size_overflow = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect_batches())
+
+    async def submit(self, items: Sequence, timings: Optional[Dict[str, float]] = None) -> List:
+        if not items:
+            return []
+
+        self._ensure_worker()
+        request = _BatchRequest(items, self._loop.create_future())
+        self._queue.put_nowait(request)
+
+        with timed_stage(timings, self.stage):
+            return await request.future
+
+    async def _collect_batches(self):
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            batch_items = len(first.items)
+            deadline = first.enqueued_at + self.max_wait
+
+            while batch_items < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                batch_items += len(request.items)
+
+            # Dispatch without awaiting so the next batch can gather while this one runs. The runner
+            # keeps the task referenced until it finishes and logs anything it raises.
+            background_runner.spawn(self._dispatch(batch), name=f"{self.stage}_batch")
+
+    async def _dispatch(self, batch: List[_BatchRequest]):
+        dispatched_at = time.perf_counter()
+        try:
+            items = [item for request in batch for item in request.items]
+            self._record_batch(batch, len(items), dispatched_at)
+            outputs = await inference_executor.run(self._batch_fn, items)
+        except asyncio.CancelledError:
+            # Cancelled at shutdown: callers must not wait on their futures forever
+            for request in batch:
+                request.future.cancel()
+            raise
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in batch:
+            size = len(request.items)
+            if not request.future.done():
+                request.future.set_result(list(outputs[offset:offset + size]))
+            offset += size
+
+    def _record_batch(self, batch: List[_BatchRequest], size: int, dispatched_at: float):
+        self.batches += 1
+        self.requests += len(batch)
+        self.items_processed += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+
+        for bucket in self.BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self.batch_size_histogram[bucket] += 1
+                break
+        else:
+            self.batch_size_overflow += 1
+
+        for request in batch:
+            wait = dispatched_at - request.enqueued_at
+            self.queue_wait_total += wait
+            self.queue_wait_max = max(self.queue_wait_max, wait)
+
+    def stats(self) -> Dict:
+        histogram = {f"le_{bucket}": count for bucket, count in self.batch_size_histogram.items()}
+        histogram["overflow"] = self.batch_size_overflow
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "items_processed": self.items_processed,
+            "avg_batch_size": round(self.items_processed / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "batch_size_histogram": histogram,
+            "avg_queue_wait_ms": round(self.queue_wait_total / self.requests * 1000, 3) if self.requests else 0.0,
+            "max_queue_wait_ms": round(self.queue_wait_max * 1000, 3),
+        }
+
+    async def close(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
 
 class VectorStoreService:
     _instance = None
+    # The first construction loads the models and the index. It normally runs on the
+    # startup loader thread, but scripts and ingest jobs may race it.
+    _init_lock = threading.Lock()
 
     def __new__(cls, index_path: str = "data/faiss_index"):
         if cls._instance is None:
@@ -18,55 +194,534 @@ class VectorStoreService:
     def __init__(self, index_path: str = "data/faiss_index"):
         if getattr(self, "initialized", False):
             return
-            
+        with self._init_lock:
+            if not self.initialized:
+                self._initialize(index_path)
+
+    @classmethod
+    def loaded(cls) -> Optional["VectorStoreService"]:
+        """The instance if it has finished loading, without triggering a load."""
+        instance = cls._instance
+        return instance if instance is not None and instance.initialized else None
+
+    def _initialize(self, index_path: str):
         self.index_path = index_path
         
-        self.embeddings = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
+        # PyTorch (sentence-transformers) or ONNX Runtime, per INFERENCE_BACKEND
+        self.embeddings, self.reranker, self.inference_backend = load_models()
         
-        print("Loading Reranker Model...")
-        self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+        self.rerank_scheduler = MicroBatchScheduler(
+            self.reranker.predict,
+            max_wait_ms=settings.RERANK_MAX_WAIT_MS,
+            max_batch=settings.RERANK_MAX_BATCH,
+            stage="rerank"
+        )
+
+        # Normalized query text -> embedding, so hot questions skip the MiniLM forward pass
+        self.query_embedding_cache = LRUCache(
+            max_entries=settings.QUERY_EMBED_CACHE_SIZE,
+            ttl_seconds=settings.QUERY_EMBED_CACHE_TTL_SECONDS
+        )
+        self.embed_scheduler = MicroBatchScheduler(
+            self.embeddings.embed_documents,
+            max_wait_ms=settings.EMBED_MAX_WAIT_MS,
+            max_batch=settings.EMBED_MAX_BATCH,
+            stage="embed"
+        )
         
+        # Filtered searches fan out one task per document type
+        self._partition_pool = ThreadPoolExecutor(
+            max_workers=settings.INDEX_PARTITION_SEARCH_THREADS, thread_name_prefix="partition-search"
+        )
+
         self.vector_db = None
+        # Bumped whenever the index contents change, so caches keyed on retrieval results can invalidate
+        self.generation = 0
         self._load_index()
+        self._register_metrics()
         self.initialized = True
 
+    def _register_metrics(self):
+        registry.callback(
+            "rag_query_embedding_cache_lookups_total", "Query embedding cache lookups", "counter",
+            lambda: [({"result": "hit"}, self.query_embedding_cache.hits), ({"result": "miss"}, self.query_embedding_cache.misses)],
+            labelnames=("result",)
+        )
+        schedulers = (self.embed_scheduler, self.rerank_scheduler)
+        registry.callback(
+            "rag_batches_total", "Micro-batched model calls", "counter",
+            lambda: [({"stage": s.stage}, s.batches) for s in schedulers], labelnames=("stage",)
+        )
+        registry.callback(
+            "rag_batch_items_total", "Items scored in micro-batched model calls", "counter",
+            lambda: [({"stage": s.stage}, s.items_processed) for s in schedulers], labelnames=("stage",)
+        )
+        registry.callback(
+            "rag_index_vectors", "Vectors in the FAISS index", "gauge",
+            lambda: [({}, self.vector_db.index.ntotal if self.vector_db is not None else 0)]
+        )
+        registry.callback(
+            "rag_index_partition_vectors", "Vectors in the FAISS index per document type", "gauge",
+            lambda: [
+                ({"type": doc_type or "none"}, count)
+                for doc_type, count in (self.vector_db.partitions.stats().items() if self.vector_db is not None else ())
+            ],
+            labelnames=("type",)
+        )
+
+    CURRENT_FILE = "CURRENT"
+    WRITE_LOG_FILE = "wal.jsonl"
+    LOCK_FILE = "index.lock"
+
+    def _read_current_base(self) -> Optional[str]:
+        """Name of the base snapshot directory the CURRENT pointer refers to."""
+        pointer = os.path.join(self.index_path, self.CURRENT_FILE)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+
     def _load_index(self):
-        if os.path.exists(self.index_path):
+        # Layout: <index_path>/CURRENT -> base-NNNNNN/ (full snapshot) + wal.jsonl (chunks added since).
+        # Several processes (uvicorn workers, ingest_kb.py) can serve and change the same directory:
+        # every change happens under an inter-process lock, and the others catch up through refresh().
+        self._write_lock = InterProcessLock(os.path.join(self.index_path, self.LOCK_FILE))
+        self._compaction_thread: Optional[threading.Thread] = None
+        # Deleted chunk ids: filtered out of search results until compaction drops their rows
+        self._tombstones: Set[str] = set()
+        self.write_log = IndexWriteLog(os.path.join(self.index_path, self.WRITE_LOG_FILE))
+
+        with self._write_lock:
+            base_name = self._read_current_base()
+            self._base_name = base_name
+            self._base_version = int(base_name.rsplit("-", 1)[-1]) if base_name else 0
+            # Indexes saved before the write log existed live directly in index_path
+            base_dir = os.path.join(self.index_path, base_name) if base_name else self.index_path
+            migrate_legacy = False
+
             try:
-                self.vector_db = FAISS.load_local(
-                    self.index_path, 
-                    self.embeddings, 
-                    allow_dangerous_deserialization=True
-                )
-                print("Loaded existing FAISS index.")
+                if os.path.exists(os.path.join(base_dir, "text.bin")):
+                    self.vector_db = self._open_snapshot(base_dir)
+                elif os.path.exists(os.path.join(base_dir, "index.pkl")):
+                    if not settings.ALLOW_LEGACY_PICKLE_INDEX:
+                        raise ValueError("index uses the legacy pickled docstore and ALLOW_LEGACY_PICKLE_INDEX is off")
+                    self.vector_db = PartitionedFAISS.load_local(
+                        base_dir, 
+                        self.embeddings, 
+                        allow_dangerous_deserialization=True
+                    )
+                    migrate_legacy = True
+
+                if self.vector_db is not None:
+                    configure_search(self.vector_db.index)
+                    print(f"Loaded existing FAISS index: {describe_index(self.vector_db.index)}")
+                    if index_type_of(self.vector_db.index) != settings.FAISS_INDEX_TYPE:
+                        print(f"Configured FAISS_INDEX_TYPE={settings.FAISS_INDEX_TYPE} differs from the stored index. Run rebuild_index.py to convert it.")
+                else:
+                    print("No existing index found. Starting fresh.")
             except Exception as e:
                 print(f"Failed to load index: {e}. Creating new one.")
                 self.vector_db = None
+                migrate_legacy = False
+
+            self.vector_db = self._replay_write_log(self.vector_db, self._tombstones)
+
+            if migrate_legacy:
+                print("Migrating pickled docstore to the memory-mapped chunk store...")
+                self.compact()
+
+    def _open_snapshot(self, base_dir: str) -> FAISS:
+        index = faiss.read_index(os.path.join(base_dir, "index.faiss"))
+        store = ChunkStore(base_dir)
+        return PartitionedFAISS(self.embeddings, index, SnapshotDocstore(store), SnapshotIdMap(store))
+
+    def _replay_write_log(self, vector_db: Optional[FAISS], tombstones: Set[str], start: int = 0,
+                          serving: bool = False) -> Optional[FAISS]:
+        """
+        Apply write-log records from byte offset start on (the whole log at load, only
+        new records when catching up). When vector_db is serving searches, new chunks
+        go into a fork of it and the fork is returned.
+        """
+        started = time.perf_counter()
+        ids, texts, vectors, metadatas = [], [], [], []
+        for record in self.write_log.replay(start):
+            if record.get("op") == "delete":
+                tombstones.update(record["ids"])
+                continue
+            if record.get("op") == "restore":
+                tombstones.difference_update(record["ids"])
+                continue
+            # Records already folded into the base (crash between snapshot and log truncation) are skipped
+            if vector_db is not None and isinstance(vector_db.docstore.search(record["id"]), Document):
+                continue
+            ids.append(record["id"])
+            texts.append(record["text"])
+            vectors.append(record["vector"])
+            metadatas.append(record["metadata"])
+
+        if ids:
+            vector_db = self._add_embeddings(vector_db, ids, texts, vectors, metadatas, serving)
+            print(f"Replayed {len(ids)} chunks from the index write log in {time.perf_counter() - started:.2f}s")
+        return vector_db
+
+    def _add_embeddings(self, vector_db: Optional[FAISS], ids: List[str], texts: List[str], vectors: List, metadatas: List[Dict],
+                        serving: bool = False) -> FAISS:
+        if vector_db is None:
+            index = faiss.IndexFlatL2(len(vectors[0]))
+            vector_db = PartitionedFAISS(self.embeddings, index, SnapshotDocstore(None), SnapshotIdMap(None))
+        elif serving:
+            # Searches run on other threads: never add to the index they are reading
+            vector_db = vector_db.fork()
+            configure_search(vector_db.index)
+        vector_db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        return vector_db
+
+    def _apply_embeddings(self, ids: List[str], texts: List[str], vectors: List, metadatas: List[Dict]):
+        # Built off to the side and swapped in whole, like a new generation
+        self.vector_db = self._add_embeddings(self.vector_db, ids, texts, vectors, metadatas, serving=True)
+
+    def _changed_on_disk(self) -> bool:
+        return self._read_current_base() != self._base_name or self.write_log.size_bytes != self.write_log.offset
+
+    def refresh(self) -> bool:
+        """
+        Pick up changes another process committed to the shared index directory.
+        Returns False right away (one tiny read and a stat) when there are none.
+        """
+        if not self._changed_on_disk():
+            return False
+        with self._write_lock:
+            return self._catch_up()
+
+    def _catch_up(self) -> bool:
+        """
+        Bring this process up to date with the index on disk. Called with _write_lock
+        held: by refresh(), and by every writer before it changes anything, so no
+        process ever writes on top of a stale view.
+        """
+        if not self._changed_on_disk():
+            return False
+
+        base_name = self._read_current_base()
+        if base_name != self._base_name or self.write_log.size_bytes < self.write_log.offset:
+            # A new generation (compaction or rebuild): build it off to the side and swap it in
+            # whole. In-flight searches keep their reference to the old one.
+            vector_db = self._open_snapshot(os.path.join(self.index_path, base_name)) if base_name else None
+            if vector_db is not None:
+                configure_search(vector_db.index)
+            tombstones: Set[str] = set()
+            vector_db = self._replay_write_log(vector_db, tombstones)
+            self.vector_db, self._tombstones = vector_db, tombstones
+            self._base_name = base_name
+            self._base_version = int(base_name.rsplit("-", 1)[-1]) if base_name else 0
+            logger.info(f"Switched to index generation {base_name}")
         else:
-            print("No existing index found. Starting fresh.")
+            # Writers append whole commits under the lock, so the log never ends mid-commit here.
+            # New chunks go into a fork that is swapped in whole, so searches never see a partial add.
+            tombstones = set(self._tombstones)
+            vector_db = self._replay_write_log(self.vector_db, tombstones, self.write_log.offset, serving=True)
+            self.vector_db, self._tombstones = vector_db, tombstones
+
+        self.write_log.records = self.write_log.count_records()
+        self.generation += 1
+        return True
+
+    @staticmethod
+    def chunk_id(text: str, source: Optional[str], occurrence: int = 0) -> str:
+        """
+        Content-addressed chunk id: a hash of the whitespace-normalized text and its
+        source. Identical chunks repeated within a source are numbered by occurrence.
+        """
+        key = f"{source or ''}\x00{' '.join(text.split())}"
+        if occurrence:
+            key += f"\x00{occurrence}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    @classmethod
+    def assign_chunk_ids(cls, documents: Iterable[Document], occurrences: Optional[Counter] = None) -> List[Document]:
+        """
+        Set metadata["chunk_id"] on each document. Pass the same occurrences counter
+        when a source is assigned ids in several calls (e.g. page by page).
+        """
+        occurrences = occurrences if occurrences is not None else Counter()
+        documents = list(documents)
+        for doc in documents:
+            base_id = cls.chunk_id(doc.page_content, doc.metadata.get("source"))
+            doc.metadata["chunk_id"] = cls.chunk_id(doc.page_content, doc.metadata.get("source"), occurrences[base_id])
+            occurrences[base_id] += 1
+        return documents
+
+    def _contains(self, doc_id: str) -> bool:
+        return self.vector_db is not None and isinstance(self.vector_db.docstore.search(doc_id), Document)
+
+    def source_chunk_ids(self, source: str) -> Set[str]:
+        """Ids of the live (not deleted) chunks ingested from source."""
+        with self._write_lock:
+            self._catch_up()
+            if self.vector_db is None:
+                return set()
+            return set(self.vector_db.docstore.ids_with("source", source)) - self._tombstones
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
 
     def add_documents(self, documents: List[Document]):
+        """
+        Embed and add documents. Only the new chunks are written to disk (append
+        to the write log); the base index is rewritten by background compaction.
+        """
         if not documents:
             return
 
-        if self.vector_db is None:
-            self.vector_db = FAISS.from_documents(documents, self.embeddings)
+        vectors = self.embed_documents([doc.page_content for doc in documents])
+        self.add_embedded_documents(documents, vectors)
+
+    def add_embedded_documents(self, documents: List[Document], vectors: List):
+        """Commit documents whose embeddings were already computed (e.g. by the ingestion pipeline)."""
+        if not documents:
+            return
+
+        # Counted once here so prompt packing never re-tokenizes stored chunks
+        for doc in documents:
+            if "token_count" not in doc.metadata:
+                doc.metadata["token_count"] = token_manager.chunk_token_count(doc.page_content)
+
+        with self._write_lock:
+            self._catch_up()
+            restored, new_ids, new_documents, new_vectors = [], [], [], []
+            for doc, vector in zip(documents, vectors):
+                doc_id = doc.metadata.get("chunk_id") or str(uuid.uuid4())
+                if doc_id in self._tombstones:
+                    # Same content as a deleted chunk: un-delete it instead of adding a second row
+                    restored.append(doc_id)
+                elif doc_id in new_ids or self._contains(doc_id):
+                    continue
+                else:
+                    new_ids.append(doc_id)
+                    new_documents.append(doc)
+                    new_vectors.append(vector)
+
+            if restored:
+                self.write_log.append_op("restore", restored)
+                self._tombstones = self._tombstones - set(restored)
+            if new_ids:
+                texts = [doc.page_content for doc in new_documents]
+                metadatas = [doc.metadata for doc in new_documents]
+                self.write_log.append(new_ids, texts, new_vectors, metadatas)
+                self._apply_embeddings(new_ids, texts, new_vectors, metadatas)
+            if restored or new_ids:
+                self.generation += 1
+
+        self._maybe_compact()
+
+    def delete_documents(self, ids: Iterable[str]) -> int:
+        """
+        Delete chunks by docstore id. Rows are tombstoned (hidden from search) and
+        physically dropped at the next compaction.
+        """
+        with self._write_lock:
+            self._catch_up()
+            ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._tombstones and self._contains(doc_id)]
+            if not ids:
+                return 0
+            self.write_log.append_op("delete", ids)
+            self._tombstones = self._tombstones | set(ids)
+            self.generation += 1
+
+        self._maybe_compact()
+        return len(ids)
+
+    def sync_documents(self, source: str, documents: List[Document]) -> Dict[str, int]:
+        """
+        Make the chunks stored for source match documents: unchanged chunks are
+        skipped, new or changed ones are embedded and added, and chunks no longer
+        present are deleted. Only the delta is embedded.
+        """
+        self.assign_chunk_ids(documents)
+        existing = self.source_chunk_ids(source)
+        wanted = {doc.metadata["chunk_id"] for doc in documents}
+        to_add = [doc for doc in documents if doc.metadata["chunk_id"] not in existing]
+
+        self.add_documents(to_add)
+        removed = self.delete_documents(existing - wanted)
+        return {"added": len(to_add), "skipped": len(documents) - len(to_add), "removed": removed}
+
+    def _maybe_compact(self):
+        if (self.write_log.records < settings.INDEX_COMPACTION_THRESHOLD
+                and len(self._tombstones) < settings.INDEX_TOMBSTONE_COMPACTION_THRESHOLD):
+            return
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.compact, name="index-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def _iter_rows(self, rows: Iterable[int]):
+        for row in rows:
+            doc_id = self.vector_db.index_to_docstore_id[row]
+            doc = self.vector_db.docstore.search(doc_id)
+            yield doc_id, doc.page_content, doc.metadata
+
+    def compact(self):
+        """
+        Write a full snapshot (FAISS index + memory-mapped chunk store) as a new
+        base directory, atomically repoint CURRENT at it, then truncate the write
+        log and drop old bases. Tombstoned rows are left out of the snapshot.
+        """
+        with self._write_lock:
+            self._catch_up()
+            if self.vector_db is None:
+                return
+
+            start = time.perf_counter()
+            logged_chunks = self.write_log.records
+            self._base_version += 1
+            base_name = f"base-{self._base_version:06d}"
+            base_dir = os.path.join(self.index_path, base_name)
+            os.makedirs(base_dir, exist_ok=True)
+
+            index = self.vector_db.index
+            rows = np.arange(index.ntotal)
+            purged = len(self._tombstones)
+            if purged:
+                id_map = self.vector_db.index_to_docstore_id
+                rows = np.asarray([row for row in rows if id_map[row] not in self._tombstones], dtype=np.int64)
+                index = build_index(self.stored_vectors()[rows], index_type_of(index))
+                configure_search(index)
+
+            faiss.write_index(index, os.path.join(base_dir, "index.faiss"))
+            ChunkStore.write(base_dir, self._iter_rows(rows))
+
+            pointer = os.path.join(self.index_path, self.CURRENT_FILE)
+            with open(pointer + ".tmp", 'w', encoding='utf-8') as f:
+                f.write(base_name)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer + ".tmp", pointer)
+
+            # Serve text and metadata from the new snapshot so the in-memory docstore can be freed.
+            # Swapped in whole: in-flight searches keep a consistent view of the old one.
+            store = ChunkStore(base_dir)
+            self.vector_db = PartitionedFAISS(self.embeddings, index, SnapshotDocstore(store), SnapshotIdMap(store))
+
+            self._tombstones = set()
+            self._base_name = base_name
+
+            self.write_log.reset()
+            self._remove_stale_bases(base_name)
+            print(f"[INDEX] Compacted {logged_chunks} log records ({purged} deleted chunks purged) into {base_name} in {time.perf_counter() - start:.2f}s")
+
+    def _remove_stale_bases(self, current: str):
+        for name in os.listdir(self.index_path):
+            path = os.path.join(self.index_path, name)
+            if name.startswith("base-") and name != current and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        # Pre-write-log snapshot files are superseded by the first compaction
+        for legacy in ("index.faiss", "index.pkl"):
+            legacy_path = os.path.join(self.index_path, legacy)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        # MiniLM is uncased, so lowercasing and collapsing whitespace does not change the embedding
+        return " ".join(query.lower().split())
+
+    def _cached_embeddings(self, queries: List[str]) -> Tuple[List[str], List[Optional[List[float]]], List[str]]:
+        """Return (normalized keys, cached vectors or None, unique keys still to embed)."""
+        keys = [self.normalize_query(q) for q in queries]
+        vectors = [self.query_embedding_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        return keys, vectors, missing
+
+    def _fill_embeddings(self, keys: List[str], vectors: List, missing: List[str], computed: List) -> List[List[float]]:
+        fresh = dict(zip(missing, computed))
+        for key, vector in fresh.items():
+            self.query_embedding_cache.put(key, vector)
+        return [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
+
+    def embed_queries(self, queries: List[str], timings: Optional[Dict[str, float]] = None) -> List[List[float]]:
+        """Embed several queries with one batched forward pass, skipping cached ones."""
+        keys, vectors, missing = self._cached_embeddings(queries)
+        computed = []
+        if missing:
+            with timed_stage(timings, "embed"):
+                computed = self.embeddings.embed_documents(missing)
+        return self._fill_embeddings(keys, vectors, missing, computed)
+
+    def embed_query(self, query: str, timings: Optional[Dict[str, float]] = None) -> List[float]:
+        return self.embed_queries([query], timings)[0]
+
+    async def aembed_queries(self, queries: List[str], timings: Optional[Dict[str, float]] = None) -> List[List[float]]:
+        """Async embed_queries: cache misses are micro-batched with other in-flight requests."""
+        keys, vectors, missing = self._cached_embeddings(queries)
+        computed = await self.embed_scheduler.submit(missing, timings) if missing else []
+        return self._fill_embeddings(keys, vectors, missing, computed)
+
+    def _dense_search(self, query_vector: List[float], fetch_k: int, timings: Optional[Dict[str, float]] = None,
+                      metadata_filter: Optional[Dict[str, Set[str]]] = None, stage: str = "faiss_search") -> List[Tuple[Document, float]]:
+        """Run the FAISS search for an already embedded query (CPU-bound), over the partitions the filter selects."""
+        with timed_stage(timings, stage):
+            vector_db = self.vector_db
+            tombstones = self._tombstones
+            # Over-fetch so deleted chunks can be dropped without shrinking the candidate set
+            fetch = fetch_k + len(tombstones)
+            if metadata_filter is None:
+                results = vector_db.similarity_search_with_score_by_vector(query_vector, k=fetch)
+            else:
+                results = self._partition_search(vector_db, query_vector, fetch, metadata_filter)
+            if tombstones:
+                results = [(doc, score) for doc, score in results if doc.id not in tombstones]
+            return results[:fetch_k]
+
+    def _partition_search(self, vector_db: PartitionedFAISS, query_vector: List[float], fetch_k: int,
+                          metadata_filter: Dict[str, Set[str]]) -> List[Tuple[Document, float]]:
+        groups = list(vector_db.partitions.select(metadata_filter).values())
+        if sum(len(rows) for rows in groups) == vector_db.index.ntotal:
+            return vector_db.similarity_search_with_score_by_vector(query_vector, k=fetch_k)
+
+        query = np.asarray([query_vector], dtype=np.float32)
+        if len(groups) == 1:
+            hits = self._search_rows(vector_db.index, query, groups[0], fetch_k)
         else:
-            self.vector_db.add_documents(documents)
-        
-        self.save_index()
+            # One task per document type; faiss releases the GIL, so large partitions are scanned concurrently
+            futures = [self._partition_pool.submit(self._search_rows, vector_db.index, query, rows, fetch_k) for rows in groups]
+            hits = heapq.nsmallest(fetch_k, (hit for future in futures for hit in future.result()), key=lambda hit: hit[1])
 
-    def search(self, query: str, k: int = 4) -> List[Document]:
-        if self.vector_db is None:
-            return []
-        
-        # 1. Broad Search with scores
-        # Get similarity scores to enable fast-track detection
-        candidates_with_scores = self.vector_db.similarity_search_with_score(query, k=k*3)
-        
-        if not candidates_with_scores:
-            return []
-        
+        id_map, docstore = vector_db.index_to_docstore_id, vector_db.docstore
+        return [(docstore.search(id_map[row]), distance) for row, distance in hits]
+
+    @staticmethod
+    def _search_rows(index: faiss.Index, query: np.ndarray, rows: np.ndarray, fetch_k: int) -> List[Tuple[int, float]]:
+        """Nearest of the given rows: exact over their vectors for small partitions, an ID-filtered index search for large ones."""
+        if len(rows) <= settings.INDEX_PARTITION_EXACT_MAX_ROWS:
+            distances, positions = faiss.knn(query, index.reconstruct_batch(rows), min(fetch_k, len(rows)))
+            labels = rows[positions[0]]
+        else:
+            distances, labels = index.search(query, fetch_k, params=search_parameters(index, faiss.IDSelectorBatch(rows)))
+            labels = labels[0]
+        return [(int(row), float(distance)) for row, distance in zip(labels, distances[0]) if row >= 0]
+
+    def _retrieve(self, query_vector: List[float], k: int, timings: Optional[Dict[str, float]] = None,
+                  metadata_filter: Optional[Dict[str, Set[str]]] = None) -> Tuple[List[Tuple[Document, float]], Optional[List[Document]]]:
+        """
+        (candidates to rerank, fast-tracked top-k). The small Golden KB partition is
+        searched first; a confident match there is returned without touching the rest.
+        """
+        kb_hits = []
+        if allows(metadata_filter, "type", KB_TYPE):
+            kb_hits = self._dense_search(query_vector, k, timings, {**(metadata_filter or {}), "type": {KB_TYPE}}, stage="kb_search")
+            fast_tracked = self._fast_track(kb_hits, k) if kb_hits else None
+            if fast_tracked is not None:
+                return kb_hits, fast_tracked
+
+        candidates = self._dense_search(query_vector, k * 3, timings, metadata_filter)
+        # PDF chunks can crowd KB entries out of the candidates: the reranker always sees the closest ones
+        seen = {doc.id for doc, _ in candidates}
+        candidates += [(doc, score) for doc, score in kb_hits if doc.id not in seen]
+        return candidates, None
+
+    def _fast_track(self, candidates_with_scores: List[Tuple[Document, float]], k: int) -> Optional[List[Document]]:
+        """Return the top-k directly when the best hit is a confident Golden KB match."""
         # FAST TRACK: Check if top result has very high similarity (Golden KB match)
         # Similarity scores in FAISS are distances (lower = better for L2, higher = better for cosine)
         # For the default L2 distance, we check if distance is very low
@@ -79,31 +734,116 @@ class VectorStoreService:
         is_high_confidence = top_score < 0.5  # Low distance = high similarity
         
         if is_kb_entry and is_high_confidence:
-            print(f"[FAST TRACK] Golden KB match detected (score: {top_score:.4f}), skipping reranking")
+            fast_track_hits.inc()
+            logger.debug(f"[FAST TRACK] Golden KB match detected (score: {top_score:.4f}), skipping reranking")
             # Return top k candidates directly without reranking
             return [doc for doc, score in candidates_with_scores[:k]]
-        
-        # 2. Standard Path: Reranking (The Advanced Step)
-        # Extract just the documents for reranking
-        candidates = [doc for doc, score in candidates_with_scores]
-        
+        return None
+
+    def _rerank(self, query: str, candidates: List[Document], timings: Optional[Dict[str, float]] = None) -> List[float]:
+        """Score (query, chunk) pairs with the CrossEncoder (CPU-bound)."""
         # We pair the query with each document text: [(Query, Doc1), (Query, Doc2)...]
         model_inputs = [[query, doc.page_content] for doc in candidates]
         
         # The CrossEncoder gives a precise relevance score (logits) for each pair
-        scores = self.reranker.predict(model_inputs)
+        with timed_stage(timings, "rerank"):
+            return self.reranker.predict(model_inputs)
+
+    def search(self, query: str, k: int = 4, timings: Optional[Dict[str, float]] = None,
+               metadata_filter: Optional[MetadataFilter] = None) -> List[Document]:
+        """
+        Synchronous search. Blocks the calling thread; use asearch from async code.
+        metadata_filter restricts the search to chunks whose type/source/category
+        is one of the given values, e.g. {"type": "pdf", "source": ["a.pdf", "b.pdf"]}.
+        """
+        metadata_filter = normalize_filter(metadata_filter)
+        if self.vector_db is None:
+            return []
+        
+        # 1. Broad Search with scores
+        # Get similarity scores to enable fast-track detection
+        query_vector = self.embed_query(query, timings)
+        candidates_with_scores, fast_tracked = self._retrieve(query_vector, k, timings, metadata_filter)
+        if fast_tracked is not None:
+            return fast_tracked
+        
+        if not candidates_with_scores:
+            return []
+        
+        # 2. Standard Path: Reranking (The Advanced Step), as much as the candidates need
+        cascade = RerankCascade(candidates_with_scores, k, settings.RERANK_QUALITY)
+        while batch := cascade.next_batch():
+            cascade.add(self._rerank(query, batch, timings))
         
         # 3. Sort & Filter
-        # Combine docs with scores, sort descending
-        results_with_scores = sorted(
-            zip(candidates, scores), 
-            key=lambda x: x[1], 
-            reverse=True
-        )
+        return cascade.result()
+
+    async def asearch(self, query: str, k: int = 4, timings: Optional[Dict[str, float]] = None,
+                      metadata_filter: Optional[MetadataFilter] = None) -> List[Document]:
+        """
+        Same pipeline as search, but embedding, FAISS and reranking run on the
+        bounded inference executor so the event loop keeps serving other requests.
+        Embedding and reranking calls are micro-batched across concurrent queries.
+
+        Raises InferenceQueueFull when the executor is saturated, ValueError on a filter
+        over metadata that is not partitioned.
+        """
+        metadata_filter = normalize_filter(metadata_filter)
+        if self.vector_db is None:
+            return []
+
+        timings = timings if timings is not None else {}
+
+        query_vector = (await self.aembed_queries([query], timings))[0]
+        candidates_with_scores, results = await inference_executor.run(self._retrieve, query_vector, k, timings, metadata_filter)
         
-        # Return top k truly relevant documents
-        return [doc for doc, score in results_with_scores[:k]]
+        if results is None and not candidates_with_scores:
+            return []
+        
+        if results is None:
+            cascade = RerankCascade(candidates_with_scores, k, settings.RERANK_QUALITY)
+            while batch := cascade.next_batch():
+                if settings.RERANK_BATCHING_ENABLED:
+                    pairs = [(query, doc.page_content) for doc in batch]
+                    scores = await self.rerank_scheduler.submit(pairs, timings)
+                else:
+                    scores = await inference_executor.run(self._rerank, query, batch, timings)
+                cascade.add(scores)
+            results = cascade.result()
+
+        logger.info("Search timings: " + ", ".join(f"{stage}={secs * 1000:.1f}ms" for stage, secs in timings.items()))
+        return results
+
+    def stored_vectors(self) -> np.ndarray:
+        """All indexed vectors in FAISS row order. Re-embeds chunk text when the index is lossy (PQ)."""
+        index = self.vector_db.index
+        if not is_lossy(index):
+            return reconstruct_all(index)
+
+        print("Index is product-quantized, re-embedding chunk text to recover exact vectors...")
+        texts = [
+            self.vector_db.docstore.search(self.vector_db.index_to_docstore_id[i]).page_content
+            for i in range(index.ntotal)
+        ]
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+    def rebuild_index(self, index_type: Optional[str] = None) -> Dict:
+        """
+        Rebuild the FAISS index from the stored vectors as the given type
+        (defaults to FAISS_INDEX_TYPE). Row order, and therefore the docstore
+        mapping, is preserved.
+        """
+        if self.vector_db is None:
+            raise ValueError("No index to rebuild. Ingest documents first.")
+
+        with self._write_lock:
+            self._catch_up()
+            vectors = self.stored_vectors()
+            self.vector_db.index = build_index(vectors, index_type or settings.FAISS_INDEX_TYPE)
+            self.generation += 1
+            self.save_index()
+        return describe_index(self.vector_db.index)
 
     def save_index(self):
-        if self.vector_db:
-            self.vector_db.save_local(self.index_path)
+        """Persist the full index synchronously (used after a rebuild)."""
+        self.compact()
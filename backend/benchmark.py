@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Ensure backend directory is in python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# The module-level agent builds a Groq client on import; the benchmark never calls it
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+import numpy as np
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.core.token_manager import token_manager
+from app.services.adaptive_rerank import rerank_decisions, rerank_pairs
+from app.services.agent import AgentDeps, ComplianceAgent
+from app.services.faiss_index import INDEX_TYPES, describe_index
+from app.services.followup_service import followup_service
+from app.services.inference_backends import BACKENDS
+from app.services.intent_index import build_intent_index, intent_index
+from app.services.stub_llm import StubChatModel
+from app.services.vector_store import VectorStoreService
+from ingest_kb import KB_FILE_PATH, format_entry_to_text, load_kb_entries
+
+
+def kb_documents(kb_data):
+    source = kb_data.get("source_document", {}).get("title")
+    return [
+        Document(
+            page_content=format_entry_to_text(entry, kb_data),
+            metadata={
+                "id": entry.get("id"),
+                "category": entry.get("category"),
+                "title": entry.get("title"),
+                "source": source,
+                "type": "kb_entry"
+            }
+        )
+        for entry in kb_data.get("entries", [])
+    ]
+
+
+def synthetic_documents(kb_data, size, seed, words_per_chunk=120, chunks_per_source=50):
+    """Distractor PDF chunks drawn from the KB vocabulary, so they compete with the KB entries."""
+    rng = np.random.default_rng(seed)
+    vocabulary = sorted({
+        word.strip(".,:;()\"'").lower()
+        for entry in kb_data.get("entries", [])
+        for word in format_entry_to_text(entry, kb_data).split()
+    } - {""})
+
+    documents = []
+    for i in range(size):
+        source = f"synthetic-{i // chunks_per_source:04d}.pdf"
+        words = rng.choice(vocabulary, size=words_per_chunk)
+        header = f"DOMARIN: REGULATORY_COMPLIANCE\nSOURCE_DOC: {source}\nDOC_TYPE: pdf\nCONTEXT_LAYER: Global\n---\n"
+        documents.append(Document(
+            page_content=header + " ".join(words),
+            metadata={"source": source, "type": "pdf", "page": i % chunks_per_source}
+        ))
+    return documents
+
+
+def labelled_queries(kb_data):
+    return [
+        (intent, entry.get("id"))
+        for entry in kb_data.get("entries", [])
+        for intent in entry.get("question_intents", [])
+    ]
+
+
+def summarize(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    if not len(values):
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def process_memory():
+    """Resident and peak resident memory of this process, in MB."""
+    memory = {}
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    memory["rss_mb" if line.startswith("VmRSS") else "peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        import resource
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["peak_rss_mb"] = round(peak / (2**20 if sys.platform == "darwin" else 1024), 1)
+    return memory
+
+
+def timed(samples, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def benchmark_stages(vector_store, queries, k):
+    """Time each retrieval stage in isolation, bypassing the query-embedding cache."""
+    samples = {stage: [] for stage in ("kb_intent", "embed", "faiss_search", "rerank", "context_packing")}
+    for query, _ in queries:
+        timed(samples["kb_intent"], intent_index.match, query)
+        vector = timed(samples["embed"], vector_store.embeddings.embed_query, query)
+        candidates = timed(samples["faiss_search"], vector_store._dense_search, vector, k * 3)
+        docs = [doc for doc, _ in candidates]
+        timed(samples["rerank"], vector_store._rerank, query, docs)
+        timed(samples["context_packing"], token_manager.pack_context, docs[:k], "", query)
+    return {stage: summarize(values) for stage, values in samples.items()}
+
+
+RERANK_BRANCHES = ("full", "trimmed", "early_exit", "gap_skip")
+
+
+def benchmark_recall(vector_store, queries, k):
+    """recall@k and MRR of the full search pipeline (fast track + rerank) against the labelled KB ids."""
+    hits, reciprocal_ranks, latencies = 0, [], []
+    decisions_before = {branch: rerank_decisions.value(branch=branch) for branch in RERANK_BRANCHES}
+    scored_before = rerank_pairs.value(stage="scored")
+    for query, expected_id in queries:
+        vector_store.query_embedding_cache.clear()
+        results = timed(latencies, vector_store.search, query, k)
+        ranked_ids = [doc.metadata.get("id") for doc in results]
+        rank = ranked_ids.index(expected_id) + 1 if expected_id in ranked_ids else None
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    return {
+        "queries": len(queries),
+        f"recall@{k}": round(hits / len(queries), 4) if queries else 0.0,
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4) if queries else 0.0,
+        "search": summarize(latencies),
+        # Searches past the KB fast track, by adaptive rerank branch, and CrossEncoder pairs scored
+        "rerank_branches": {branch: int(rerank_decisions.value(branch=branch) - before) for branch, before in decisions_before.items()},
+        "rerank_pairs_scored": int(rerank_pairs.value(stage="scored") - scored_before),
+    }
+
+
+async def benchmark_agent(agent, deps, queries, intent_match=True):
+    """End-to-end ComplianceAgent.run (KB intent match, else retrieval + fast path or stub LLM)."""
+    settings.KB_INTENT_MATCH_ENABLED = intent_match
+    latencies, paths = [], {}
+    for query, _ in queries:
+        deps.vector_store.query_embedding_cache.clear()
+        start = time.perf_counter()
+        result = await agent.run(query, deps)
+        latencies.append(time.perf_counter() - start)
+        path = result.data.conversation_type
+        paths[path] = paths.get(path, 0) + 1
+    return {"run": summarize(latencies), "answer_paths": paths}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval and agent benchmark (no Groq key, no MongoDB).")
+    parser.add_argument("--corpus-size", type=int, default=2000, help="Synthetic distractor chunks added next to the KB")
+    parser.add_argument("--k", type=int, default=5, help="Documents returned per query (the agent uses 5)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help=f"FAISS index type to benchmark (default: FAISS_INDEX_TYPE={settings.FAISS_INDEX_TYPE})")
+    parser.add_argument("--inference-backend", choices=BACKENDS, default=None,
+                        help=f"Embedding/CrossEncoder runtime (default: INFERENCE_BACKEND={settings.INFERENCE_BACKEND}). "
+                             "Run once per backend to compare latency and memory")
+    parser.add_argument("--onnx-quantized", action=argparse.BooleanOptionalAction, default=settings.ONNX_QUANTIZED,
+                        help="With --inference-backend onnx, serve the int8 models")
+    parser.add_argument("--rerank-quality", type=float, default=settings.RERANK_QUALITY,
+                        help="Adaptive reranking trade-off, 1.0 = rerank every candidate (default: RERANK_QUALITY)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency of the stub chat model")
+    parser.add_argument("--warmup", type=int, default=5, help="Queries run once before measuring")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    if not os.path.exists(KB_FILE_PATH):
+        print(f"Error: File {KB_FILE_PATH} not found.")
+        return
+
+    kb_data = load_kb_entries(KB_FILE_PATH)
+    queries = labelled_queries(kb_data)
+    # Answers must come from the pipeline on every run, never from the semantic cache
+    settings.ANSWER_CACHE_ENABLED = False
+    # Match against this KB, not whatever intent index ingest_kb.py last wrote
+    intent_index.load(build_intent_index(kb_data, followup_service))
+
+    if args.inference_backend:
+        settings.INFERENCE_BACKEND = args.inference_backend
+    settings.ONNX_QUANTIZED = args.onnx_quantized
+    settings.RERANK_QUALITY = args.rerank_quality
+
+    index_dir = tempfile.mkdtemp(prefix="benchmark-index-")
+    try:
+        start = time.perf_counter()
+        vector_store = VectorStoreService(index_path=index_dir)
+        models = {
+            "inference_backend": vector_store.inference_backend,
+            "embedding_model": getattr(vector_store.embeddings, "model_file", "pytorch"),
+            "reranker_model": getattr(vector_store.reranker, "model_file", "pytorch"),
+            "load_seconds": round(time.perf_counter() - start, 3),
+            **process_memory(),
+        }
+
+        print(f"Indexing {len(kb_data.get('entries', []))} KB entries and {args.corpus_size} synthetic chunks...")
+        start = time.perf_counter()
+        vector_store.add_documents(kb_documents(kb_data))
+        vector_store.add_documents(synthetic_documents(kb_data, args.corpus_size, args.seed))
+        if (args.index_type or settings.FAISS_INDEX_TYPE) != "flat":
+            vector_store.rebuild_index(args.index_type)
+        index_seconds = time.perf_counter() - start
+
+        for query, _ in queries[:args.warmup]:
+            vector_store.search(query, args.k)
+
+        print(f"Running {len(queries)} labelled queries...")
+        agent = ComplianceAgent(llm=StubChatModel(latency_ms=args.llm_latency_ms))
+        results = {
+            "config": {
+                "corpus_size": args.corpus_size,
+                "kb_entries": len(kb_data.get("entries", [])),
+                "k": args.k,
+                "llm_latency_ms": args.llm_latency_ms,
+                "rerank_quality": args.rerank_quality,
+                "seed": args.seed,
+            },
+            "models": models,
+            "index": {**describe_index(vector_store.vector_db.index), "build_seconds": round(index_seconds, 3)},
+            "stages": benchmark_stages(vector_store, queries, args.k),
+            "retrieval": benchmark_recall(vector_store, queries, args.k),
+            "agent": asyncio.run(benchmark_agent(agent, AgentDeps(vector_store), queries)),
+            "agent_without_intent_match": asyncio.run(benchmark_agent(agent, AgentDeps(vector_store), queries, intent_match=False)),
+        }
+        results["models"]["after_run"] = process_memory()
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    retrieval = results["retrieval"]
+    models = results["models"]
+    print(f"\nmodels: {models['inference_backend']} ({models['embedding_model']}, {models['reranker_model']}), "
+          f"loaded in {models['load_seconds']:.2f}s, RSS {models.get('rss_mb', '-')} MB after load, "
+          f"peak {models['after_run'].get('peak_rss_mb', '-')} MB")
+    print(f"\n{'stage':<18} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9}")
+    rows = {**results["stages"], "search": retrieval["search"], "agent_run": results["agent"]["run"],
+            "agent_run_dense": results["agent_without_intent_match"]["run"]}
+    for stage, row in rows.items():
+        print(f"{stage:<18} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+    print(f"\nrecall@{args.k}: {retrieval[f'recall@{args.k}']:.4f}   MRR: {retrieval['mrr']:.4f}   "
+          f"answer paths: {results['agent']['answer_paths']}")
+    print(f"rerank (quality {args.rerank_quality}): {retrieval['rerank_pairs_scored']} pairs scored, "
+          f"branches {retrieval['rerank_branches']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
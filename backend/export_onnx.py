@@ -0,0 +1,262 @@
+import argparse
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Ensure backend directory is in python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from app.core.config import settings
+from app.services.inference_backends import (
+    EMBEDDING_DIR, EMBEDDING_MODEL, MANIFEST_FILE, MANIFEST_FORMAT_VERSION, MODEL_FILE, POOLING_MODES,
+    QUANTIZED_MODEL_FILE, RERANKER_DIR, RERANKER_MODEL, TOKENIZER_FILE, ONNXCrossEncoder, ONNXEmbeddings,
+)
+from ingest_kb import KB_FILE_PATH, format_entry_to_text, load_kb_entries
+
+
+def _export(torch_model, tokenizer, model_dir, output_name, opset):
+    """Export a HF transformer to model_dir/model.onnx with dynamic batch and sequence axes."""
+    import torch
+
+    class Outputs(torch.nn.Module):
+        # Positional inputs for the exporter, one named output
+        def __init__(self, model, input_names):
+            super().__init__()
+            self.model = model
+            self.input_names = input_names
+
+        def forward(self, *inputs):
+            return getattr(self.model(**dict(zip(self.input_names, inputs)), return_dict=True), output_name)
+
+    sample = tokenizer(["an example query", "a longer example passage for the export"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    output_axes = {0: "batch", 1: "sequence"} if output_name == "last_hidden_state" else {0: "batch"}
+
+    # The TorchScript exporter handles these encoder-only models without extra dependencies
+    options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    torch_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            Outputs(torch_model, input_names),
+            tuple(sample[name] for name in input_names),
+            os.path.join(model_dir, MODEL_FILE),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names}, output_name: output_axes},
+            opset_version=opset,
+            do_constant_folding=True,
+            **options
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(model_dir, TOKENIZER_FILE))
+    return {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "exported_at": time.time(),
+        "input_names": input_names,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "quantized": False,
+    }
+
+
+def export_embedding_model(embedder, model_dir, opset):
+    from sentence_transformers.models import Normalize, Pooling, Transformer
+
+    transformer = embedder[0]
+    pooling = next((module for module in embedder if isinstance(module, Pooling)), None)
+    if not isinstance(transformer, Transformer) or pooling is None or pooling.get_pooling_mode_str() not in POOLING_MODES:
+        raise SystemExit(f"Unsupported module layout for {EMBEDDING_MODEL}: {embedder}")
+
+    manifest = _export(transformer.auto_model, transformer.tokenizer, model_dir, "last_hidden_state", opset)
+    manifest.update({
+        "source_model": EMBEDDING_MODEL,
+        "max_length": embedder.max_seq_length,
+        "pooling": pooling.get_pooling_mode_str(),
+        "normalize": any(isinstance(module, Normalize) for module in embedder),
+    })
+    return manifest
+
+
+def export_reranker(reranker, model_dir, opset):
+    import torch
+
+    manifest = _export(reranker.model, reranker.tokenizer, model_dir, "logits", opset)
+    manifest.update({
+        "source_model": RERANKER_MODEL,
+        # CrossEncoder truncates to max_length, else to what the tokenizer allows
+        "max_length": reranker.max_length or min(reranker.tokenizer.model_max_length, 512),
+        "activation": "sigmoid" if isinstance(reranker.default_activation_function, torch.nn.Sigmoid) else "identity",
+    })
+    return manifest
+
+
+def quantize(model_dir):
+    """int8 dynamic quantization: weights stored as int8, activations quantized per call."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        os.path.join(model_dir, MODEL_FILE), os.path.join(model_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8
+    )
+
+
+def _ranks(values):
+    return np.argsort(np.argsort(-np.asarray(values), kind="stable"), kind="stable")
+
+
+def _agreement(reference, candidate, k):
+    """Top-1 agreement, overlap@k and Spearman correlation of two score rows over the same items."""
+    reference_top = np.argsort(-reference, kind="stable")[:k]
+    candidate_top = np.argsort(-candidate, kind="stable")[:k]
+    spearman = np.corrcoef(_ranks(reference), _ranks(candidate))[0, 1] if len(reference) > 1 else 1.0
+    return reference_top[0] == candidate_top[0], len(set(reference_top) & set(candidate_top)) / len(reference_top), spearman
+
+
+def check_parity(embedder, reranker, output_dir, model_file, queries, documents, k, candidates):
+    """
+    Compare an exported variant against the PyTorch models on the Golden KB:
+    which documents each query retrieves (embeddings) and how the retrieved
+    candidates are ordered (reranker).
+    """
+    onnx_embeddings = ONNXEmbeddings(os.path.join(output_dir, EMBEDDING_DIR), model_file == QUANTIZED_MODEL_FILE, 0)
+    onnx_reranker = ONNXCrossEncoder(os.path.join(output_dir, RERANKER_DIR), model_file == QUANTIZED_MODEL_FILE, 0)
+
+    # SentenceTransformerEmbeddings flattens newlines the same way
+    texts = [text.replace("\n", " ") for text in queries + documents]
+    torch_vectors = np.asarray(embedder.encode(texts), dtype=np.float32)
+    onnx_vectors = np.asarray(onnx_embeddings.embed_documents(texts), dtype=np.float32)
+    cosine = (torch_vectors * onnx_vectors).sum(axis=1) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1)
+    )
+
+    embedding_rows, rerank_rows, score_diffs = [], [], []
+    torch_queries, onnx_queries = torch_vectors[:len(queries)], onnx_vectors[:len(queries)]
+    torch_docs, onnx_docs = torch_vectors[len(queries):], onnx_vectors[len(queries):]
+    for query, torch_query, onnx_query in zip(queries, torch_queries, onnx_queries):
+        torch_scores = torch_docs @ torch_query
+        embedding_rows.append(_agreement(torch_scores, onnx_docs @ onnx_query, k))
+
+        # Rerank what retrieval would hand the CrossEncoder
+        pool = np.argsort(-torch_scores, kind="stable")[:candidates]
+        pairs = [[query, documents[i]] for i in pool]
+        reference = np.asarray(reranker.predict(pairs), dtype=np.float32)
+        scores = np.asarray(onnx_reranker.predict(pairs), dtype=np.float32)
+        rerank_rows.append(_agreement(reference, scores, k))
+        score_diffs.append(float(np.abs(reference - scores).max()))
+
+    def summary(rows):
+        top1, overlap, spearman = (np.asarray(column, dtype=np.float64) for column in zip(*rows))
+        return {"top1_agreement": round(float(top1.mean()), 4), f"overlap@{k}": round(float(overlap.mean()), 4),
+                "spearman": round(float(np.nanmean(spearman)), 4)}
+
+    return {
+        "queries": len(queries),
+        "documents": len(documents),
+        "embedding": {**summary(embedding_rows), "min_cosine": round(float(cosine.min()), 5), "mean_cosine": round(float(cosine.mean()), 5)},
+        "reranker": {**summary(rerank_rows), "max_score_diff": round(max(score_diffs), 5)},
+    }
+
+
+def _write_manifest(model_dir, manifest):
+    with open(os.path.join(model_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the embedding model and CrossEncoder to ONNX (INFERENCE_BACKEND=onnx) and check them against PyTorch."
+    )
+    parser.add_argument("--output-dir", default=settings.ONNX_MODEL_DIR, help=f"Default: ONNX_MODEL_DIR={settings.ONNX_MODEL_DIR}")
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 dynamically quantized models")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--queries", type=int, default=200, help="KB question intents used for the parity check")
+    parser.add_argument("--k", type=int, default=5, help="Top-k compared for ranking agreement (the agent uses 5)")
+    parser.add_argument("--candidates", type=int, default=15, help="Candidates reranked per query (search uses k*3 = 15)")
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="Minimum top-1 agreement and overlap@k with PyTorch; variants below it are never served")
+    parser.add_argument("--skip-parity", action="store_true", help="Export without comparing against PyTorch")
+    parser.add_argument("--output", help="Write the parity report as JSON to this path")
+    args = parser.parse_args()
+
+    if not args.skip_parity and not os.path.exists(KB_FILE_PATH):
+        print(f"Error: File {KB_FILE_PATH} not found (needed for the parity check; use --skip-parity to export anyway).")
+        return 1
+
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    print(f"Loading {EMBEDDING_MODEL} and {RERANKER_MODEL} (PyTorch)...")
+    embedder = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    reranker = CrossEncoder(RERANKER_MODEL, device="cpu")
+
+    # Built next to the target and swapped in whole; running servers only read it at startup
+    output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=".onnx-export-", dir=os.path.dirname(output_dir))
+    try:
+        manifests = {}
+        for name, export in ((EMBEDDING_DIR, lambda d: export_embedding_model(embedder, d, args.opset)),
+                             (RERANKER_DIR, lambda d: export_reranker(reranker, d, args.opset))):
+            model_dir = os.path.join(staging_dir, name)
+            os.makedirs(model_dir)
+            print(f"Exporting {name} model...")
+            manifests[name] = export(model_dir)
+            if not args.no_quantize:
+                print(f"Quantizing {name} model to int8...")
+                quantize(model_dir)
+                manifests[name]["quantized"] = True
+            _write_manifest(model_dir, manifests[name])
+
+        report, failed = {}, []
+        if not args.skip_parity:
+            kb_data = load_kb_entries(KB_FILE_PATH)
+            queries = [intent for entry in kb_data.get("entries", []) for intent in entry.get("question_intents", [])][:args.queries]
+            documents = [format_entry_to_text(entry, kb_data) for entry in kb_data.get("entries", [])]
+            variants = [MODEL_FILE] + ([] if args.no_quantize else [QUANTIZED_MODEL_FILE])
+
+            print(f"\nParity against PyTorch: {len(queries)} queries, {len(documents)} KB entries, k={args.k}")
+            print(f"{'variant':<16} {'model':<10} {'top1':>7} {'overlap@' + str(args.k):>10} {'spearman':>9}")
+            for model_file in variants:
+                report[model_file] = check_parity(embedder, reranker, staging_dir, model_file, queries, documents, args.k, args.candidates)
+                for name, key in ((EMBEDDING_DIR, "embedding"), (RERANKER_DIR, "reranker")):
+                    row = report[model_file][key]
+                    passed = min(row["top1_agreement"], row[f"overlap@{args.k}"]) >= args.min_agreement
+                    manifests[name].setdefault("parity", {})[model_file] = {**row, "passed": passed}
+                    if not passed:
+                        failed.append(f"{name}/{model_file}")
+                    print(f"{model_file:<16} {name:<10} {row['top1_agreement']:>7.4f} {row[f'overlap@{args.k}']:>10.4f} "
+                          f"{row['spearman']:>9.4f}{'' if passed else '  FAILED'}")
+            for name, manifest in manifests.items():
+                _write_manifest(os.path.join(staging_dir, name), manifest)
+
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(staging_dir, output_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    for name in manifests:
+        model_dir = os.path.join(output_dir, name)
+        sizes = ", ".join(
+            f"{file} {os.path.getsize(os.path.join(model_dir, file)) / 2**20:.1f} MB"
+            for file in (MODEL_FILE, QUANTIZED_MODEL_FILE) if os.path.exists(os.path.join(model_dir, file))
+        )
+        print(f"{model_dir}: {sizes}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if failed:
+        # Kept on disk for inspection; the onnx backend refuses these and serves PyTorch instead
+        print(f"\nParity check failed for {', '.join(failed)} (min agreement {args.min_agreement})")
+        return 1
+    print(f"\nDone. Set INFERENCE_BACKEND=onnx to serve these models.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
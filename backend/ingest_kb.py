@@ -7,6 +7,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from langchain_core.documents import Document
 from app.services.vector_store import VectorStoreService
+from app.services.followup_service import followup_service
+from app.services.intent_index import build_intent_index, save_intent_index
+from app.core.config import settings
 
 KB_FILE_PATH = "data/knowledge_base.json"
 
@@ -87,8 +90,19 @@ def run_ingestion():
     print("Initializing Vector Store...")
     vector_store = VectorStoreService()
     
-    print(f"Ingesting {len(documents)} documents into FAISS...")
-    vector_store.add_documents(documents)
+    print(f"Syncing {len(documents)} documents into FAISS...")
+    by_source = {}
+    for doc in documents:
+        by_source.setdefault(doc.metadata["source"], []).append(doc)
+
+    for source, source_documents in by_source.items():
+        report = vector_store.sync_documents(source, source_documents)
+        print(f"{source}: {report['added']} added, {report['skipped']} unchanged, {report['removed']} removed")
+
+    # Exact/fuzzy question-intent lookup served ahead of retrieval (picked up by running servers)
+    intent_index = build_intent_index(kb_data, followup_service)
+    save_intent_index(intent_index, settings.KB_INTENT_INDEX_PATH)
+    print(f"Wrote {len(intent_index['intents'])} question intents to {settings.KB_INTENT_INDEX_PATH}")
     
     print("Ingestion Complete!")
 
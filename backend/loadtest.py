@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+KB_FILE_PATH = os.path.join(BACKEND_DIR, "data", "knowledge_base.json")
+
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Open-ended questions that usually miss the Golden KB fast path and go through rerank + LLM
+GENERIC_QUERIES = [
+    "How long should we retain customer transaction records?",
+    "What controls are expected for third-party vendor risk?",
+    "Does our incident response plan need board approval?",
+    "What evidence do auditors expect for access reviews?",
+    "How should we document exceptions to a compliance policy?",
+    "What are the reporting obligations after a data breach?",
+    "Is annual compliance training mandatory for contractors?",
+    "How do we assess whether a process is non-compliant?",
+]
+
+FOLLOW_UPS = [
+    "Can you explain that in more detail?",
+    "What does that mean for a small company?",
+    "Which clauses apply here?",
+    "Tell me more about the next steps.",
+]
+
+
+def load_kb_queries():
+    if not os.path.exists(KB_FILE_PATH):
+        return []
+    with open(KB_FILE_PATH, 'r', encoding='utf-8') as f:
+        kb_data = json.load(f)
+    return [intent for entry in kb_data.get("entries", []) for intent in entry.get("question_intents", [])]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    """
+    Run the real app under uvicorn with the stub LLM and the in-memory database,
+    from a scratch copy of data/ so ingestion never touches the real index.
+    """
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    shutil.copytree(os.path.join(BACKEND_DIR, "data"), os.path.join(workdir, "data"),
+                    ignore=shutil.ignore_patterns("uploads"))
+    port = free_port()
+    env = {
+        **os.environ,
+        "LLM_PROVIDER": "stub",
+        "STUB_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "MONGODB_URI": "memory://",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "loadtest"),
+    }
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+               "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    log = open(os.path.join(workdir, "server.log"), 'w', encoding='utf-8')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    print(f"Started uvicorn (pid {process.pid}) on port {port}, log: {log.name}")
+    return process, f"http://127.0.0.1:{port}", workdir
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # Readiness, not liveness: the port opens before the models have loaded
+            response = await client.get("/api/v1/health/ready")
+            if response.status_code == 200:
+                print(f"Server ready, time to ready {response.json()['time_to_ready_seconds']}s")
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(1.0)
+    raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+
+class LevelStats:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, kind: str, status: str, seconds: float):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == "200":
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    @property
+    def total(self) -> int:
+        return sum(self.statuses.values())
+
+    @property
+    def succeeded(self) -> int:
+        return self.statuses.get("200", 0)
+
+
+async def timed_request(client, stats: LevelStats, kind: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        status = str(response.status_code)
+    except httpx.HTTPError as e:
+        response, status = None, f"exception:{type(e).__name__}"
+    stats.record(kind, status, time.perf_counter() - start)
+    return response if status == "200" else None
+
+
+async def virtual_user(client, stats: LevelStats, deadline: float, rng: random.Random, args, kb_queries):
+    """One user: a fresh session per question, followed by a chain of follow-ups."""
+    while time.monotonic() < deadline:
+        use_kb = kb_queries and rng.random() < args.kb_fraction
+        query = rng.choice(kb_queries) if use_kb else rng.choice(GENERIC_QUERIES)
+        response = await timed_request(client, stats, "query", "POST", "/api/v1/query/", json={"query": query})
+        if response is None:
+            continue
+
+        session_id = response.json().get("session_id")
+        for _ in range(args.followups):
+            if time.monotonic() >= deadline:
+                break
+            await timed_request(client, stats, "follow_up", "POST", "/api/v1/query/",
+                                json={"query": rng.choice(FOLLOW_UPS), "session_id": session_id})
+
+
+async def ingest_driver(client, stats: LevelStats, deadline: float, args):
+    with open(args.ingest_file, 'rb') as f:
+        payload = f.read()
+    filename = os.path.basename(args.ingest_file)
+    while time.monotonic() < deadline:
+        await timed_request(client, stats, "ingest", "POST", "/api/v1/ingest/",
+                            files={"files": (filename, payload, "application/pdf")})
+        await asyncio.sleep(args.ingest_interval)
+
+
+def summarize_latencies(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    histogram = {f"le_{bucket}": 0 for bucket in LATENCY_BUCKETS_MS}
+    histogram["overflow"] = 0
+    for value in values:
+        for bucket in LATENCY_BUCKETS_MS:
+            if value <= bucket:
+                histogram[f"le_{bucket}"] += 1
+                break
+        else:
+            histogram["overflow"] += 1
+    if not len(values):
+        return {"count": 0, "histogram_ms": histogram}
+    return {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "max_ms": round(float(values.max()), 1),
+        "histogram_ms": histogram,
+    }
+
+
+def loop_lag_delta(before, after):
+    """Lag distribution between two cumulative /health snapshots."""
+    if not before or not after:
+        return None
+    samples = after["samples"] - before["samples"]
+    histogram = {key: after["histogram_ms"][key] - before["histogram_ms"].get(key, 0) for key in after["histogram_ms"]}
+    p99_bound = None
+    if samples:
+        seen = 0
+        for key, count in histogram.items():
+            seen += count
+            if seen >= 0.99 * samples:
+                p99_bound = key
+                break
+    return {
+        "samples": samples,
+        "avg_lag_ms": round((after["total_lag_ms"] - before["total_lag_ms"]) / samples, 3) if samples else 0.0,
+        "p99_bucket": p99_bound,
+        "histogram_ms": histogram,
+    }
+
+
+async def loop_lag_snapshot(client):
+    try:
+        response = await client.get("/api/v1/health/")
+        return response.json().get("event_loop_lag")
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def run_level(client, concurrency: int, args, kb_queries):
+    stats = LevelStats()
+    lag_before = await loop_lag_snapshot(client)
+    start = time.monotonic()
+    deadline = start + args.duration
+
+    tasks = [
+        virtual_user(client, stats, deadline, random.Random(args.seed * 1000 + i), args, kb_queries)
+        for i in range(concurrency)
+    ]
+    if args.ingest_file:
+        tasks.append(ingest_driver(client, stats, deadline, args))
+    await asyncio.gather(*tasks)
+
+    elapsed = time.monotonic() - start
+    lag_after = await loop_lag_snapshot(client)
+    return {
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": stats.total,
+        "throughput_rps": round(stats.succeeded / elapsed, 2),
+        "error_rate": round(1 - stats.succeeded / stats.total, 4) if stats.total else 0.0,
+        "status_counts": stats.statuses,
+        "latency": {kind: summarize_latencies(samples) for kind, samples in stats.latencies.items()},
+        "event_loop_lag": loop_lag_delta(lag_before, lag_after),
+    }
+
+
+def find_knee(levels, tolerance: float, max_error_rate: float):
+    """Highest concurrency whose query p95 stays within tolerance of the lowest level's p95."""
+    baseline = levels[0]["latency"].get("query", {}).get("p95_ms") if levels else None
+    best = None
+    for level in levels:
+        p95 = level["latency"].get("query", {}).get("p95_ms")
+        if baseline is None or p95 is None:
+            break
+        if p95 > baseline * (1 + tolerance) or level["error_rate"] > max_error_rate:
+            break
+        best = level
+    return {
+        "baseline_query_p95_ms": baseline,
+        "max_concurrency": best["concurrency"] if best else None,
+        "max_throughput_rps": best["throughput_rps"] if best else None,
+    }
+
+
+async def run(args):
+    kb_queries = load_kb_queries()
+    process, workdir = None, None
+    base_url = args.url
+    if not base_url:
+        process, base_url, workdir = start_server(args)
+
+    max_concurrency = max(args.concurrency)
+    limits = httpx.Limits(max_connections=max_concurrency + 2, max_keepalive_connections=max_concurrency + 2)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client, args.startup_timeout)
+            for query in (kb_queries + GENERIC_QUERIES)[:args.warmup]:
+                await client.post("/api/v1/query/", json={"query": query})
+
+            levels = []
+            for concurrency in args.concurrency:
+                level = await run_level(client, concurrency, args, kb_queries)
+                levels.append(level)
+                query_latency = level["latency"].get("query", {})
+                lag = level["event_loop_lag"] or {}
+                print(
+                    f"c={concurrency:<4} {level['throughput_rps']:>8.2f} req/s  "
+                    f"p50={query_latency.get('p50_ms', '-')}ms p95={query_latency.get('p95_ms', '-')}ms "
+                    f"p99={query_latency.get('p99_ms', '-')}ms  errors={level['error_rate']:.2%}  "
+                    f"loop lag avg={lag.get('avg_lag_ms', '-')}ms p99<={lag.get('p99_bucket', '-')}"
+                )
+                await asyncio.sleep(args.cooldown)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {
+            "url": args.url or "spawned",
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "followups": args.followups,
+            "kb_fraction": args.kb_fraction,
+            "llm_latency_ms": args.llm_latency_ms,
+            "answer_cache": args.answer_cache,
+            "ingest_file": args.ingest_file,
+        },
+        "levels": levels,
+        "knee": find_knee(levels, args.p95_tolerance, args.max_error_rate),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test with a concurrency sweep against the FastAPI app.")
+    parser.add_argument("--url", help="Target an already running server instead of spawning one with the stub LLM and in-memory DB")
+    parser.add_argument("--concurrency", type=lambda value: [int(c) for c in value.split(",")], default=[1, 2, 4, 8, 16, 32],
+                        help="Comma-separated concurrent users per level")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument("--followups", type=int, default=2, help="Follow-up questions per session")
+    parser.add_argument("--kb-fraction", type=float, default=0.5, help="Share of opening questions taken from KB question_intents")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Stub LLM latency (spawned server only)")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on (spawned server only)")
+    parser.add_argument("--ingest-file", help="PDF uploaded to /ingest/ every --ingest-interval seconds during each level")
+    parser.add_argument("--ingest-interval", type=float, default=5.0)
+    parser.add_argument("--warmup", type=int, default=5, help="Requests sent before the sweep")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="Pause between levels")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--p95-tolerance", type=float, default=0.5, help="Allowed p95 growth over the first level for the knee")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the spawned server's scratch directory and log")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    knee = report["knee"]
+    print(f"\nMax concurrency within p95 tolerance: {knee['max_concurrency']} "
+          f"({knee['max_throughput_rps']} req/s, baseline query p95 {knee['baseline_query_p95_ms']}ms)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,51 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from app.api.routes import router as api_router
 from app.core.config import settings
+from app.core.background import background_runner
 from app.core.database import db
 from app.core.middleware import logging_middleware
+from app.core.inference import inference_executor
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import registry
+from app.services.vector_store import VectorStoreService
+from app.services.ingestion_pipeline import ingestion_pipeline
+from app.services.ingest_jobs import ingest_job_manager
+from app.services.chat_history import chat_history_service
+from app.services.model_loader import model_loader
+from app.services.index_refresher import index_refresher
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     db.connect()
+    try:
+        await chat_history_service.ensure_indexes()
+    except Exception as e:
+        print(f"✗ Could not create chat history indexes: {e}")
+    loop_monitor.start()
+    # Models and index load in the background; /health/ready reports when they are done
+    model_loader.start()
+    # Other workers and scripts may change the index; poll for new commits and generations
+    index_refresher.start()
+    await ingest_job_manager.resume_pending()
     yield
+    await loop_monitor.stop()
+    await model_loader.stop()
+    await index_refresher.stop()
+    await ingest_job_manager.shutdown()
+    # Chat turns still being saved, then (write-behind) queued messages, before the connection goes away
+    await background_runner.drain()
+    await chat_history_service.close()
+    vector_store = VectorStoreService.loaded()
+    if vector_store is not None:
+        await vector_store.rerank_scheduler.close()
+        await vector_store.embed_scheduler.close()
     db.close()
+    inference_executor.shutdown()
+    ingestion_pipeline.shutdown()
 
 app = FastAPI(
     title=settings.PROJECT_NAME, 
@@ -35,3 +69,8 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 @app.get("/")
 def root():
     return {"message": "Welcome to the Regulatory Compliance Assistant API", "docs": "/docs"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import sys
+
+# Ensure backend directory is in python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import faiss
+import numpy as np
+from app.core.config import settings
+from app.services.faiss_index import INDEX_TYPES, build_index, describe_index, evaluate_index
+from app.services.vector_store import VectorStoreService
+
+KB_FILE_PATH = "data/knowledge_base.json"
+
+
+def load_report_queries(vector_store, vectors, num_queries, seed=13):
+    """KB question intents as real queries, topped up with jittered stored vectors."""
+    queries = []
+    if os.path.exists(KB_FILE_PATH):
+        with open(KB_FILE_PATH, 'r', encoding='utf-8') as f:
+            kb_data = json.load(f)
+        intents = [intent for entry in kb_data.get("entries", []) for intent in entry.get("question_intents", [])]
+        if intents:
+            queries.extend(vector_store.embed_queries(intents[:num_queries]))
+
+    rng = np.random.default_rng(seed)
+    missing = num_queries - len(queries)
+    if missing > 0 and len(vectors):
+        sample = vectors[rng.integers(0, len(vectors), size=missing)]
+        noisy = sample + rng.normal(0, 0.02, size=sample.shape).astype(np.float32)
+        queries.extend(noisy / np.linalg.norm(noisy, axis=1, keepdims=True))
+
+    return np.asarray(queries, dtype=np.float32)
+
+
+def run_report(vector_store, index_types, num_queries, k):
+    vectors = vector_store.stored_vectors()
+    queries = load_report_queries(vector_store, vectors, num_queries)
+    print(f"Evaluating {len(queries)} queries against {len(vectors)} vectors (k={k})...")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    report = []
+    for index_type in index_types:
+        index = build_index(vectors, index_type)
+        report.extend(evaluate_index(index, ground_truth, queries, k))
+
+    print(f"\n{'index':<8} {'param':<9} {'value':>6} {'recall@' + str(k):>10} {'mean_ms':>9} {'p95_ms':>9}")
+    for row in report:
+        print(
+            f"{row['index_type']:<8} {str(row['param'] or '-'):<9} {str(row['value'] or '-'):>6} "
+            f"{row[f'recall@{k}']:>10.4f} {row['mean_ms']:>9.4f} {row['p95_ms']:>9.4f}"
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS index or compare index types.")
+    parser.add_argument("--type", choices=INDEX_TYPES, default=None,
+                        help=f"Index type to build (default: FAISS_INDEX_TYPE={settings.FAISS_INDEX_TYPE})")
+    parser.add_argument("--report", action="store_true",
+                        help="Only print a recall-vs-latency report against the exact flat index; do not modify the stored index")
+    parser.add_argument("--queries", type=int, default=200, help="Number of report queries")
+    parser.add_argument("--k", type=int, default=15, help="Neighbours per query (search uses k*3 = 15 candidates)")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    vector_store = VectorStoreService()
+    if vector_store.vector_db is None:
+        print("No index found. Run ingest_kb.py or upload documents first.")
+        return
+
+    if args.report:
+        index_types = [args.type] if args.type else list(INDEX_TYPES)
+        report = run_report(vector_store, index_types, args.queries, args.k)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport written to {args.output}")
+        return
+
+    print(f"Current index: {describe_index(vector_store.vector_db.index)}")
+    info = vector_store.rebuild_index(args.type)
+    print(f"Rebuilt index: {info}")
+
+
+if __name__ == "__main__":
+    main()